@@ -10,30 +10,41 @@ the user interface and coordinating the various components of the system.
 Copyright (c) 2023-2024
 License: Apache License 2.0 (see LICENSE file for details)
 """
+import time
+
 import pandas as pd
 import streamlit as st
 
+from httpcache import get_response_cache
+from jobs import QUEUED, RUNNING, get_job_queue, job_eta
+from retryqueue import get_retry_queue
+from data_processing import get_safedetail, searchsafe
 from dbsafe import (
-    get_safedetail,
-    searchsafe,
     display_eventdetail,
     display_summary,
     display_safesum,
-    get_sumeventdf,
-    update_sumeventdf,
-    toupt_safesum,
-    update_toupd,
-    get_safetoupd,
-    get_eventdetail,
-    download_safesum,
     update_safelabel,
     get_safecat,
 )
+from scraper import download_safesum, toupt_safesum
 
 
 # Constants
 TEMP_PATH = "temp"
 
+# Seconds between refreshes of the update page while jobs are queued or running
+JOB_POLL_INTERVAL = 5
+
+# Job labels
+JOB_LABELS = {"list": "更新列表", "detail": "更新详情", "retry": "重试失败页面"}
+JOB_STATE_LABELS = {
+    "queued": "等待中",
+    "running": "运行中",
+    "done": "完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
 # City list
 CITY_LIST = [
     "北京", "厦门", "青海", "甘肃", "天津", "河北", "贵州", "湖南", "深圳", "江西",
@@ -52,67 +63,62 @@ st.set_page_config(
 )
 
 
-def update_case_list(org_name_ls, start_num, end_num):
-    """
-    Update case lists for the selected organizations.
-    
-    Scrapes case list data from regulatory websites for each organization
-    within the specified page range and updates the local database.
-    
-    Args:
-        org_name_ls: List of organization names to update
-        start_num: Starting page number for scraping
-        end_num: Ending page number for scraping
-    """
-    for org_name in org_name_ls:
-        st.markdown(f"#### 更新列表：{org_name}")
-        start = start_num
-        end = end_num
-
-        while True:
-            # Get and update event data
-            sumeventdf = get_sumeventdf(org_name, start, end)
-            length = len(sumeventdf)
-            st.success(f"获取了{length}条案例")
-            
-            newsum = update_sumeventdf(sumeventdf, org_name)
-            sumevent_len = len(newsum)
-            st.success(f"共{sumevent_len}条案例待更新")
-
-            # If all records need updating and we have records, continue to next page
-            if sumevent_len == length and length > 0:
-                start = end + 1
-                end = end + 1
-            else:
-                break
+def rerun():
+    """Rerun the Streamlit script, on both old and new Streamlit versions."""
+    if hasattr(st, "rerun"):
+        st.rerun()
+    else:
+        st.experimental_rerun()
 
 
-def update_case_details(org_name_ls):
+def display_jobs(limit=10):
     """
-    Update case details for the selected organizations.
-    
-    Retrieves detailed case information from regulatory websites for each organization
-    that has pending updates and saves them to the local database.
-    
+    Display the recent crawl jobs and their progress.
+
+    Jobs are run by the background worker (python worker.py); this page only
+    shows the progress the worker records, so it can be refreshed at will.
+
     Args:
-        org_name_ls: List of organization names to update
+        limit: Number of recent jobs to show
+
+    Returns:
+        True if any of the jobs is queued or running
     """
-    for org_name in org_name_ls:
-        st.markdown(f"#### 更新详情：{org_name}")
-        
-        newsum = update_toupd(org_name)
-        newsum_len = len(newsum)
-        st.success(f"共{newsum_len}条案例待更新")
-        
-        if newsum_len > 0:
-            toupd = get_safetoupd(org_name)
-            st.write(toupd)
-            
-            eventdetail = get_eventdetail(toupd, org_name)
-            eventdetail_len = len(eventdetail)
-            st.success(f"更新完成，共{eventdetail_len}条案例详情")
-        else:
-            st.error("没有更新的案例")
+    queue = get_job_queue()
+    jobs = queue.recent(limit)
+
+    st.markdown("#### 更新任务")
+    if not jobs:
+        st.info("暂无任务。任务由后台进程执行：python worker.py")
+        return False
+
+    rows = []
+    for job in jobs:
+        orgs = job["params"].get("orgs", [])
+        orgstr = "、".join(orgs[:3]) + (f"等{len(orgs)}个" if len(orgs) > 3 else "")
+        eta = job_eta(job)
+        rows.append(
+            {
+                "任务": job["id"],
+                "类型": JOB_LABELS[job["kind"]],
+                "机构": orgstr,
+                "状态": JOB_STATE_LABELS[job["state"]],
+                "进度": f"{job['pages_done']}/{job['pages_total']}",
+                "案例": job["rows"],
+                "错误": job["errors"],
+                "预计剩余": f"{eta / 60:.0f}分钟" if eta is not None else "",
+                "消息": job["error"] or job["message"] or "",
+            }
+        )
+    st.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+    active = [job["id"] for job in jobs if job["state"] in (QUEUED, RUNNING)]
+    if active:
+        job_id = st.selectbox("取消任务", active)
+        if st.button("取消"):
+            queue.cancel(job_id)
+            st.success(f"已取消任务{job_id}")
+    return bool(active)
 
 
 def handle_case_search():
@@ -129,17 +135,10 @@ def handle_case_search():
     if "keywords_safe" not in st.session_state:
         st.session_state["keywords_safe"] = []
 
-    # Get and prepare data
-    dfl = get_safedetail("")
-    dfl = dfl.dropna(subset=["违法事实"])
-    dfl = dfl.fillna("")
-    
-    catdf = get_safecat()
-    dfl = pd.merge(dfl, catdf, on="link", how="left")
-    
-    # Get date ranges
-    min_date = dfl["发布日期"].min()
-    max_date = dfl["发布日期"].max()
+    # Get date ranges; only the date column is needed for the bounds
+    datedf = get_safedetail("", columns=["date"])
+    min_date = datedf["发布日期"].min().date()
+    max_date = datedf["发布日期"].max().date()
     one_year_ago = max_date - pd.Timedelta(days=365)
     
     loclist = CITY_LIST
@@ -186,6 +185,15 @@ def handle_case_search():
             min_penalty,
         ]
         
+        # Load only the partitions inside the chosen date range
+        dfl = get_safedetail("", date_range=(start_date, end_date))
+        dfl = dfl.dropna(subset=["违法事实"])
+        textcols = dfl.select_dtypes(include="object").columns
+        dfl[textcols] = dfl[textcols].fillna("")
+        
+        catdf = get_safecat()
+        dfl = pd.merge(dfl, catdf, on="link", how="left")
+        
         # Perform search
         search_df = searchsafe(
             dfl,
@@ -221,6 +229,7 @@ def handle_case_update():
     Manages organization selection and provides update options
     for case lists and case details. Includes functionality to identify
     organizations with pending updates and facilitates data refresh operations.
+    Updates are queued as jobs for the background worker.
     """
     # Select organizations
     org_name_ls = st.sidebar.multiselect("机构", CITY_LIST)
@@ -245,16 +254,43 @@ def handle_case_update():
     start_num = int(st.sidebar.number_input("起始页", value=1, min_value=1))
     end_num = int(st.sidebar.number_input("结束页", value=1))
 
-    # Update buttons
+    # Update buttons enqueue jobs for the background worker
     if st.sidebar.button("更新列表"):
-        update_case_list(org_name_ls, start_num, end_num)
+        job_id = get_job_queue().enqueue(
+            "list", {"orgs": org_name_ls, "start": start_num, "end": end_num}
+        )
+        st.sidebar.success(f"已提交任务{job_id}")
         
     if st.sidebar.button("更新详情"):
-        update_case_details(org_name_ls)
+        job_id = get_job_queue().enqueue("detail", {"orgs": org_name_ls})
+        st.sidebar.success(f"已提交任务{job_id}")
+
+    # Failed pages are retried once their backoff has passed
+    retry_counts = get_retry_queue().counts()
+    if st.sidebar.button(f"重试失败页面（{retry_counts['pending']}）"):
+        job_id = get_job_queue().enqueue("retry", {})
+        st.sidebar.success(f"已提交任务{job_id}")
+    if retry_counts["dead"]:
+        st.sidebar.caption(f"{retry_counts['dead']}页多次重试失败，见 python retryqueue.py")
+
+    # Response cache statistics, counted by the crawl worker
+    cache_stats = get_response_cache().stats()
+    st.sidebar.caption(
+        f"网页缓存：命中{cache_stats['hits']}，未变化{cache_stats['revalidated']}，"
+        f"下载{cache_stats['misses']}；共{cache_stats['entries']}页，"
+        f"{cache_stats['bytes'] / 2**20:.1f}MB"
+    )
 
     # Refresh button
+    autorefresh = st.sidebar.checkbox("自动刷新任务进度", value=True)
     if st.sidebar.button("刷新页面"):
-        st.experimental_rerun()
+        rerun()
+
+    # Poll the job progress while the worker has something to do; the page is
+    # fully drawn before the wait, and any widget interaction reruns it sooner
+    if display_jobs() and autorefresh:
+        time.sleep(JOB_POLL_INTERVAL)
+        rerun()
 
 
 def main():
@@ -0,0 +1,428 @@
+"""
+Raw HTML Archive for DBSafe
+
+Every list and detail page fetched by the scraper is archived as raw HTML
+under ``safe/archive``. Page bodies are stored once per content digest,
+compressed with zstd when the ``zstandard`` package is installed and with
+gzip otherwise. An append-only ``index.jsonl`` records the URL, fetch time,
+page kind, region and the list date of detail pages, so the case data can
+be rebuilt from the archive without crawling again.
+
+Run ``python archive.py reparse`` after changing a parser to re-extract
+the safesum/safedtl data from the archive: every distinct archived copy of
+a list page, since a list URL shows different cases over time, and the
+latest copy of every detail page. The pages are parsed by a process pool; the results are written as new
+snapshots and merged into the existing ones by compaction.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from utils import get_now, pensafe
+
+
+# Folder holding the archived pages
+ARCHIVE_PATH = os.path.join(pensafe, "archive")
+ARCHIVE_INDEX = "index.jsonl"
+
+# Page kinds and the dataset rebuilt from each
+DATASET_BY_KIND = {"list": "safesum", "detail": "safedtl"}
+
+# Archived pages parsed per worker task
+REPARSE_CHUNK = 200
+
+_archive: Optional["RawArchive"] = None
+_archive_lock = threading.Lock()
+
+
+def _zstd() -> Any:
+    """Get the zstandard module, or None if it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compress(data: bytes) -> Tuple[bytes, str]:
+    """
+    Compress a page body with zstd if available, otherwise gzip.
+
+    Args:
+        data: Page body
+
+    Returns:
+        Tuple of (compressed bytes, file extension)
+    """
+    zstd = _zstd()
+    if zstd is not None:
+        return zstd.ZstdCompressor(level=10).compress(data), ".zst"
+    return gzip.compress(data), ".gz"
+
+
+def decompress(data: bytes, ext: str) -> bytes:
+    """
+    Decompress a page body.
+
+    Args:
+        data: Compressed bytes
+        ext: File extension, ".zst" or ".gz"
+
+    Returns:
+        Page body
+
+    Raises:
+        ImportError: If the body is zstd-compressed and zstandard is not installed
+    """
+    if ext == ".zst":
+        zstd = _zstd()
+        if zstd is None:
+            raise ImportError("zstandard is required to read .zst archive blobs")
+        return zstd.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class RawArchive:
+    """Content-addressed archive of fetched pages with a JSON Lines index."""
+
+    def __init__(self, folder: str = ARCHIVE_PATH):
+        """
+        Args:
+            folder: Folder holding the archived pages
+        """
+        self.folder = folder
+        self.indexpath = os.path.join(folder, ARCHIVE_INDEX)
+        self._latest: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.folder, "blobs", digest[:2], digest + ".html" + ext)
+
+    def _find_blob(self, digest: str) -> Optional[str]:
+        """Path of the stored blob of a digest, whatever its compression."""
+        for ext in (".zst", ".gz"):
+            path = self._blob_path(digest, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put(
+        self, url: str, html: bytes, kind: str, orgname: str, region: str, **meta: Any
+    ) -> str:
+        """
+        Archive a fetched page.
+
+        The body is stored once per digest, and an index record is added
+        unless the latest record of the URL already has the same body.
+
+        Args:
+            url: Page URL
+            html: Raw page body
+            kind: "list" or "detail"
+            orgname: Organization name, stored as the 区域 of parsed rows
+            region: Region index (see dbsafe.org2name)
+            **meta: Further fields for the index, e.g. the page number or the
+                list date of a detail page
+
+        Returns:
+            Digest of the body
+        """
+        if kind not in DATASET_BY_KIND:
+            raise ValueError(f"Unknown page kind: {kind}. Use one of {list(DATASET_BY_KIND)}.")
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+
+        digest = hashlib.sha256(html).hexdigest()
+        if self._find_blob(digest) is None:
+            data, ext = compress(html)
+            path = self._blob_path(digest, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmppath, path)
+
+        record = {
+            "url": url,
+            "fetched": time.time(),
+            "kind": kind,
+            "orgname": orgname,
+            "region": region,
+            "digest": digest,
+            **meta,
+        }
+        with self._lock:
+            latest = self._load_latest()
+            if latest.get(url) == digest:
+                return digest
+            with open(self.indexpath, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            latest[url] = digest
+        return digest
+
+    def _load_latest(self) -> Dict[str, str]:
+        """Map each archived URL to the digest of its latest copy."""
+        if self._latest is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self._latest = {r["url"]: r["digest"] for r in self.records()}
+        return self._latest
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the index records in the order they were written.
+
+        Yields:
+            Index records; damaged lines are skipped
+        """
+        if not os.path.exists(self.indexpath):
+            return
+        with open(self.indexpath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def latest_records(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the latest record of every archived URL.
+
+        Args:
+            kind: Only records of this page kind (all kinds if None)
+
+        Returns:
+            Index records in the order they were written
+        """
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record in self.records():
+            if kind is None or record.get("kind") == kind:
+                latest.pop(record["url"], None)
+                latest[record["url"]] = record
+        return list(latest.values())
+
+    def distinct_records(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the latest record of every distinct body archived for each URL.
+
+        Args:
+            kind: Only records of this page kind (all kinds if None)
+
+        Returns:
+            Index records in the order they were written
+        """
+        latest: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for record in self.records():
+            if kind is None or record.get("kind") == kind:
+                key = (record["url"], record["digest"])
+                latest.pop(key, None)
+                latest[key] = record
+        return list(latest.values())
+
+    def read(self, record: Dict[str, Any]) -> bytes:
+        """
+        Read the archived body of an index record.
+
+        Args:
+            record: Index record
+
+        Returns:
+            Raw page body
+
+        Raises:
+            FileNotFoundError: If the blob is missing
+        """
+        path = self._find_blob(record["digest"])
+        if path is None:
+            raise FileNotFoundError(f"Archived page missing: {record['url']}")
+        with open(path, "rb") as f:
+            return decompress(f.read(), os.path.splitext(path)[1])
+
+
+def get_archive() -> RawArchive:
+    """
+    Get the process-wide page archive.
+
+    Returns:
+        Shared RawArchive
+    """
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = RawArchive()
+        return _archive
+
+
+def parse_records(records: List[Dict[str, Any]], folder: str = ARCHIVE_PATH) -> pd.DataFrame:
+    """
+    Parse archived pages into case rows, as the scraper does when crawling.
+
+    Runs in the re-parse worker processes.
+
+    Args:
+        records: Index records of one page kind
+        folder: Folder holding the archived pages
+
+    Returns:
+        DataFrame of the parsed rows; pages that cannot be read or parsed
+        are skipped
+    """
+    from fetcher import parse_detail_html, parse_list_html
+
+    archive = RawArchive(folder)
+    dflist = []
+    for record in records:
+        try:
+            html = archive.read(record)
+            if record["kind"] == "list":
+                df = parse_list_html(html, record["url"])
+            else:
+                row = parse_detail_html(html)
+                if not row:
+                    continue
+                df = pd.DataFrame(row, index=[0])
+                df["link"] = record["url"]
+                df["date"] = record.get("date")
+        except Exception:
+            continue
+        if df.empty:
+            continue
+        df["区域"] = record["orgname"]
+        dflist.append(df)
+
+    if not dflist:
+        return pd.DataFrame()
+    return pd.concat(dflist, ignore_index=True)
+
+
+def reparse_archive(
+    kind: str, max_workers: Optional[int] = None, folder: str = ARCHIVE_PATH
+) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """
+    Re-parse the archived pages of a kind.
+
+    List pages are parsed from every distinct archived copy, oldest first,
+    and the rows deduplicated by link with the latest copy winning; detail
+    pages from their latest copy.
+
+    Args:
+        kind: "list" or "detail"
+        max_workers: Number of worker processes (CPU count if None)
+        folder: Folder holding the archived pages
+
+    Returns:
+        Mapping of (organization name, region index) to the parsed rows
+    """
+    from compact import dedupe_links
+
+    archive = RawArchive(folder)
+    records = archive.distinct_records(kind) if kind == "list" else archive.latest_records(kind)
+    groups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault((record["orgname"], record["region"]), []).append(record)
+
+    tasks = []
+    for key, records in groups.items():
+        for i in range(0, len(records), REPARSE_CHUNK):
+            tasks.append((key, records[i : i + REPARSE_CHUNK]))
+    if not tasks:
+        return {}
+
+    parsed: Dict[Tuple[str, str], List[pd.DataFrame]] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(parse_records, records, folder) for _, records in tasks]
+        for (key, _), future in zip(tasks, futures):
+            parsed.setdefault(key, []).append(future.result())
+
+    results = {}
+    for key, dflist in parsed.items():
+        df = dedupe_links(pd.concat(dflist, ignore_index=True))
+        if not df.empty:
+            results[key] = df
+    return results
+
+
+def rebuild_from_archive(
+    kinds: Tuple[str, ...] = ("list", "detail"),
+    max_workers: Optional[int] = None,
+    folder: str = ARCHIVE_PATH,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Rebuild the case data from the archive.
+
+    The re-parsed rows of each region are saved as a new snapshot through the
+    configured storage backend; compaction then merges it with the existing
+    snapshots, the re-parsed row winning for every link.
+
+    Args:
+        kinds: Page kinds to re-parse
+        max_workers: Number of worker processes (CPU count if None)
+        folder: Folder holding the archived pages
+        dry_run: Only parse, do not write anything
+
+    Returns:
+        Mapping of snapshot name (or would-be name) to its number of rows
+    """
+    from compact import compact_tree
+    from storage import get_storage
+
+    storage = get_storage()
+    written = {}
+    for kind in kinds:
+        dataset = DATASET_BY_KIND[kind]
+        for (orgname, region), df in reparse_archive(kind, max_workers, folder).items():
+            basename = f"{dataset}{region}{get_now()}"
+            if not dry_run:
+                storage.save(df, dataset, basename)
+            written[basename] = len(df)
+
+    if written and not dry_run:
+        compact_tree(min_files=2)
+    return written
+
+
+def main() -> None:
+    """Command line entry point for the page archive."""
+    parser = argparse.ArgumentParser(description="DBSafe raw HTML archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    reparse = sub.add_parser("reparse", help="rebuild safesum/safedtl from the archive")
+    reparse.add_argument(
+        "--kind", choices=["list", "detail", "all"], default="all", help="pages to re-parse"
+    )
+    reparse.add_argument("--workers", type=int, default=None, help="worker processes")
+    reparse.add_argument("--folder", default=ARCHIVE_PATH, help="archive folder")
+    reparse.add_argument("--dry-run", action="store_true", help="parse without saving")
+
+    sub.add_parser("stats", help="show the number of archived pages")
+
+    args = parser.parse_args()
+    if args.command == "stats":
+        counts: Dict[str, int] = {}
+        for record in get_archive().latest_records():
+            counts[record["kind"]] = counts.get(record["kind"], 0) + 1
+        for kind, count in sorted(counts.items()):
+            print(f"{kind}: {count} pages")
+        return
+
+    kinds = tuple(DATASET_BY_KIND) if args.kind == "all" else (args.kind,)
+    written = rebuild_from_archive(kinds, args.workers, args.folder, args.dry_run)
+    for basename, rows in written.items():
+        print(f"{basename}: {rows} rows" + (" (dry run)" if args.dry_run else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+SQLite Case Database for DBSafe
+
+This module stores the list (safesum), detail (safedtl) and category
+(safecat) case data in an embedded SQLite database with one table per
+dataset. Every table is keyed by ``link`` so repeated scrapes of the same
+case are upserted instead of appended, and is indexed on ``区域`` and
+``发布日期`` so region and date-range reads run as indexed queries.
+
+The CSV snapshots written by savedf stay the archive of each scrape. The
+database records which snapshots it has absorbed, so syncing only parses
+files that appeared since the last sync.
+
+Run ``python casedb.py migrate`` to load the existing CSV tree.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import os
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from utils import find_csv_files, get_manifest, parse_dates, pensafe, read_csv_files
+
+
+# Database location and the tables it holds
+dbpath = os.path.join(pensafe, "cases.db")
+TABLES = ("safesum", "safedtl", "safecat")
+
+
+def _quote(name: str) -> str:
+    """Quote an identifier for use in SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _check_table(name: str) -> None:
+    """Reject table names that are not case datasets."""
+    if name not in TABLES:
+        raise ValueError(f"Unknown table: {name}. Use one of {TABLES}.")
+
+
+def connect(path: str = dbpath) -> sqlite3.Connection:
+    """
+    Open the case database, creating its folder if needed.
+
+    Args:
+        path: Path of the SQLite database file
+
+    Returns:
+        SQLite connection
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def table_columns(conn: sqlite3.Connection, name: str) -> List[str]:
+    """
+    Get the column names of a table.
+
+    Args:
+        conn: SQLite connection
+        name: Table name
+
+    Returns:
+        List of column names, empty if the table does not exist
+    """
+    rows = conn.execute(f"PRAGMA table_info({_quote(name)})").fetchall()
+    return [row[1] for row in rows]
+
+
+def ensure_table(conn: sqlite3.Connection, name: str, columns: Sequence[str]) -> None:
+    """
+    Create a case table and its indexes, adding any missing columns.
+
+    Args:
+        conn: SQLite connection
+        name: Table name
+        columns: Columns the table must hold
+    """
+    _check_table(name)
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {_quote(name)} ("
+        '"link" TEXT PRIMARY KEY, "区域" TEXT, "发布日期" TEXT)'
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {_quote(name + '_region')} "
+        f'ON {_quote(name)} ("区域", "发布日期")'
+    )
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS {_quote(name + '_date')} "
+        f'ON {_quote(name)} ("发布日期")'
+    )
+
+    existing = set(table_columns(conn, name))
+    for col in columns:
+        if col not in existing:
+            conn.execute(f"ALTER TABLE {_quote(name)} ADD COLUMN {_quote(col)} TEXT")
+
+
+def _date_key(value: Any) -> Optional[str]:
+    """Convert a date-like value to the ISO string stored in 发布日期."""
+    if value is None or value is pd.NaT:
+        return None
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def _to_records(df: pd.DataFrame) -> Tuple[List[str], List[Tuple]]:
+    """
+    Convert a case DataFrame to column names and text row tuples.
+
+    Rows without a link are dropped, and 发布日期 is derived from the
+    scraped date column.
+    """
+    df = df.dropna(subset=["link"]).reset_index(drop=True)
+    df = pd.DataFrame(
+        {col: df[col].astype(str).where(df[col].notna(), None) for col in df.columns}
+    )
+    if "date" in df.columns:
+        dates, _ = parse_dates(df["date"])
+        df["发布日期"] = dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None)
+
+    columns = list(df.columns)
+    rows = list(df.itertuples(index=False, name=None))
+    return columns, rows
+
+
+def _ensure_manifest(conn: sqlite3.Connection) -> None:
+    """Create the table recording which CSV files have been absorbed."""
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS "_ingested" ('
+        '"path" TEXT PRIMARY KEY, "tablename" TEXT, "mtime" INTEGER, "size" INTEGER)'
+    )
+
+
+def _record_files(conn: sqlite3.Connection, name: str, files: Sequence[str]) -> None:
+    """Record CSV files as absorbed into a table."""
+    _ensure_manifest(conn)
+    entries = [(path, name, mtime, size) for path, mtime, size in get_manifest(list(files))]
+    conn.executemany(
+        'INSERT OR REPLACE INTO "_ingested" ("path", "tablename", "mtime", "size") '
+        "VALUES (?, ?, ?, ?)",
+        entries,
+    )
+
+
+def _upsert(conn: sqlite3.Connection, df: pd.DataFrame, name: str) -> int:
+    """Upsert case rows using an open connection; returns rows written."""
+    if df.empty or "link" not in df.columns:
+        return 0
+
+    columns, rows = _to_records(df)
+    if not rows:
+        return 0
+
+    collist = ", ".join(_quote(c) for c in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    updates = ", ".join(
+        f"{_quote(c)} = excluded.{_quote(c)}" for c in columns if c != "link"
+    )
+    sql = f"INSERT INTO {_quote(name)} ({collist}) VALUES ({placeholders})"
+    if updates:
+        sql += f" ON CONFLICT(link) DO UPDATE SET {updates}"
+    else:
+        sql += " ON CONFLICT(link) DO NOTHING"
+
+    ensure_table(conn, name, columns)
+    conn.executemany(sql, rows)
+    return len(rows)
+
+
+def upsert_cases(
+    df: pd.DataFrame, name: str, path: str = dbpath, files: Sequence[str] = ()
+) -> int:
+    """
+    Insert or update case rows keyed by link in a single transaction.
+
+    Columns missing from df keep their stored values for existing links.
+
+    Args:
+        df: DataFrame of case rows, must contain a link column
+        name: Table name
+        path: Path of the SQLite database file
+        files: CSV snapshots holding the same rows, recorded as absorbed in
+            the same transaction (optional)
+
+    Returns:
+        Number of rows written
+    """
+    _check_table(name)
+    conn = connect(path)
+    try:
+        with conn:
+            count = _upsert(conn, df, name)
+            if files:
+                _record_files(conn, name, files)
+    finally:
+        conn.close()
+
+    return count
+
+
+def sync_table(name: str, penfolder: str = pensafe, path: str = dbpath) -> int:
+    """
+    Upsert the CSV snapshots of a table that the database has not seen yet.
+
+    Files that changed since they were absorbed are upserted again; since
+    rows are keyed by link this does not create duplicates.
+
+    Args:
+        name: Table name
+        penfolder: Folder containing the CSV snapshots
+        path: Path of the SQLite database file
+
+    Returns:
+        Number of rows upserted
+    """
+    _check_table(name)
+    current = get_manifest(find_csv_files(penfolder, name))
+
+    conn = connect(path)
+    try:
+        with conn:
+            _ensure_manifest(conn)
+            seen = set(
+                conn.execute(
+                    'SELECT "path", "mtime", "size" FROM "_ingested" WHERE "tablename" = ?',
+                    (name,),
+                ).fetchall()
+            )
+            newfiles = [entry[0] for entry in current if entry not in seen]
+            if not newfiles:
+                return 0
+
+            count = _upsert(conn, read_csv_files(newfiles), name)
+            _record_files(conn, name, newfiles)
+    finally:
+        conn.close()
+
+    return count
+
+
+def _where(
+    region: Optional[str], date_range: Optional[Tuple[Any, Any]]
+) -> Tuple[str, List[Any]]:
+    """Build the WHERE clause for region and date-range filters."""
+    clauses = []
+    params: List[Any] = []
+
+    if region:
+        clauses.append('"区域" = ?')
+        params.append(region)
+
+    if date_range is not None:
+        start, end = date_range
+        if start is not None:
+            clauses.append('"发布日期" >= ?')
+            params.append(_date_key(start))
+        if end is not None:
+            clauses.append('"发布日期" <= ?')
+            params.append(_date_key(end))
+
+    sql = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return sql, params
+
+
+def read_cases(
+    name: str,
+    columns: Optional[List[str]] = None,
+    region: Optional[str] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+    path: str = dbpath,
+) -> pd.DataFrame:
+    """
+    Read case rows, filtering by region and publication date in SQL.
+
+    Args:
+        name: Table name
+        columns: Columns to load (all columns if None)
+        region: Region (区域) to filter by (optional)
+        date_range: Inclusive (start, end) publication dates; either end
+            may be None (optional)
+        path: Path of the SQLite database file
+
+    Returns:
+        DataFrame of matching rows or empty DataFrame if the table does not exist
+    """
+    _check_table(name)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+
+    conn = connect(path)
+    try:
+        existing = table_columns(conn, name)
+        if not existing:
+            return pd.DataFrame()
+
+        if columns is None:
+            selected = existing
+        else:
+            selected = [c for c in columns if c in existing]
+        if not selected:
+            selected = ["link"]
+
+        where, params = _where(region, date_range)
+        collist = ", ".join(_quote(c) for c in selected)
+        sql = f"SELECT {collist} FROM {_quote(name)}{where}"
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    return df
+
+
+def read_links(name: str, region: Optional[str] = None, path: str = dbpath) -> List[str]:
+    """
+    Get the links stored in a table, optionally for one region.
+
+    Args:
+        name: Table name
+        region: Region (区域) to filter by (optional)
+        path: Path of the SQLite database file
+
+    Returns:
+        List of links
+    """
+    df = read_cases(name, ["link"], region=region, path=path)
+    if df.empty:
+        return []
+    return df["link"].tolist()
+
+
+def migrate_csv_tree(penfolder: str = pensafe, path: str = dbpath) -> Dict[str, int]:
+    """
+    Upsert every CSV snapshot in penfolder not yet in the case database.
+
+    Snapshots are loaded in file name order, so the latest timestamped
+    snapshot of a region wins for links that appear more than once.
+
+    Args:
+        penfolder: Folder containing the CSV snapshots
+        path: Path of the SQLite database file
+
+    Returns:
+        Mapping of table name to the number of rows upserted
+    """
+    return {name: sync_table(name, penfolder, path) for name in TABLES}
+
+
+def main() -> None:
+    """Command line entry point for case database maintenance."""
+    parser = argparse.ArgumentParser(description="DBSafe case database maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="load the CSV files into SQLite")
+    migrate.add_argument("--penfolder", default=pensafe, help="CSV snapshot folder")
+    migrate.add_argument("--db", default=dbpath, help="database file")
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        counts = migrate_csv_tree(args.penfolder, args.db)
+        for name, count in counts.items():
+            print(f"{name}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
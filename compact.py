@@ -0,0 +1,163 @@
+"""
+Snapshot Compaction for DBSafe
+
+Every list or detail update writes a new ``safesum{region}{now}.csv`` or
+``safedtl{region}{now}.csv`` snapshot under the pensafe folder. This module
+merges the snapshots of each region into a single file, keeping the latest
+row for every link, so the number of files and the rows read per page load
+stay bounded however many update runs there have been.
+
+Only files matching the snapshot naming scheme exactly are compacted; the
+``tempsum-*``, ``tempsumall-*`` and ``tempdtl-*`` checkpoints and any other
+CSV files are left alone.
+
+Run ``python compact.py`` to compact the whole tree.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import glob
+import os
+import re
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from utils import invalidate_csv_cache, pensafe, read_csv_files
+
+
+# Snapshot file names: prefix, region index and 14-digit timestamp
+SNAPSHOT_PATTERN = re.compile(
+    r"^(?P<prefix>safesum|safedtl)(?P<region>[a-z]+)(?P<ts>\d{14})\.csv$"
+)
+
+# Number of snapshots a region may accumulate before an update run compacts it
+COMPACT_THRESHOLD = 10
+
+
+def find_snapshots(penfolder: str = pensafe) -> Dict[Tuple[str, str, str], List[str]]:
+    """
+    Group the snapshot files under penfolder by folder, prefix and region.
+
+    Args:
+        penfolder: Folder containing the CSV snapshots
+
+    Returns:
+        Mapping of (folder, prefix, region) to file paths, oldest first
+    """
+    groups: Dict[Tuple[str, str, str], List[Tuple[str, str]]] = {}
+    pattern = os.path.join(penfolder, "**", "*.csv")
+
+    for filepath in glob.glob(pattern, recursive=True):
+        match = SNAPSHOT_PATTERN.match(os.path.basename(filepath))
+        if match is None:
+            continue
+        key = (os.path.dirname(filepath), match.group("prefix"), match.group("region"))
+        groups.setdefault(key, []).append((match.group("ts"), filepath))
+
+    return {key: [path for _, path in sorted(items)] for key, items in groups.items()}
+
+
+def dedupe_links(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keep the last row for every link.
+
+    Args:
+        df: Concatenated snapshot rows, oldest first
+
+    Returns:
+        Deduplicated DataFrame in the original order
+    """
+    if df.empty or "link" not in df.columns:
+        return df
+
+    # Rows without a link cannot be matched up, so they are all kept
+    haslink = df["link"].notna()
+    keep = ~haslink | ~df["link"].duplicated(keep="last")
+    df = df[keep]
+    df.reset_index(drop=True, inplace=True)
+    return df
+
+
+def compact_files(files: List[str]) -> Tuple[int, int]:
+    """
+    Replace a region's snapshots with one deduplicated snapshot.
+
+    The merged data is written to a temporary file that does not match any
+    snapshot prefix and atomically renamed over the newest snapshot, which
+    keeps its name; the older snapshots are removed afterwards. Readers
+    therefore never miss rows, at worst they briefly see duplicates.
+
+    Args:
+        files: Snapshot file paths of one region, oldest first
+
+    Returns:
+        Tuple of (rows before, rows after)
+    """
+    df = read_csv_files(files)
+    before = len(df)
+    df = dedupe_links(df)
+
+    target = files[-1]
+    tmppath = os.path.join(
+        os.path.dirname(target), ".compact-" + os.path.basename(target) + ".tmp"
+    )
+    df.to_csv(tmppath)
+    os.replace(tmppath, target)
+
+    for filepath in files[:-1]:
+        os.remove(filepath)
+
+    invalidate_csv_cache()
+    return before, len(df)
+
+
+def compact_tree(
+    penfolder: str = pensafe, min_files: int = 2, dry_run: bool = False
+) -> Dict[str, Tuple[int, int, int]]:
+    """
+    Compact every region whose snapshot count reaches min_files.
+
+    Args:
+        penfolder: Folder containing the CSV snapshots
+        min_files: Minimum number of snapshots before a region is compacted
+        dry_run: Only report what would be compacted
+
+    Returns:
+        Mapping of the compacted file name to (files merged, rows before, rows after);
+        row counts are 0 in a dry run
+    """
+    results = {}
+    for files in find_snapshots(penfolder).values():
+        if len(files) < max(min_files, 2):
+            continue
+        if dry_run:
+            before, after = 0, 0
+        else:
+            before, after = compact_files(files)
+        results[files[-1]] = (len(files), before, after)
+    return results
+
+
+def main() -> None:
+    """Command line entry point for snapshot compaction."""
+    parser = argparse.ArgumentParser(description="Compact DBSafe CSV snapshots")
+    parser.add_argument("--penfolder", default=pensafe, help="CSV snapshot folder")
+    parser.add_argument(
+        "--min-files", type=int, default=2, help="snapshots a region needs before compaction"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="only list what would change")
+    args = parser.parse_args()
+
+    results = compact_tree(args.penfolder, args.min_files, args.dry_run)
+    for target, (nfiles, before, after) in results.items():
+        if args.dry_run:
+            print(f"{target}: would merge {nfiles} files")
+        else:
+            print(f"{target}: merged {nfiles} files, {before} -> {after} rows")
+
+
+if __name__ == "__main__":
+    main()
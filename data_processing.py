@@ -1,35 +1,63 @@
 import pandas as pd
-from typing import List, Union, Optional
+from typing import Any, List, Union, Optional, Tuple
 
-from utils import get_csvdf, parse_date
+from utils import note_unparsed_dates, parse_dates
+from schema import apply_schema
+from storage import get_storage
 
 
 # Define pensafe directory constant
 pensafe = "safe"
 
 
-def get_safedetail(orgname: str = "") -> pd.DataFrame:
+def get_safedetail(
+    orgname: str = "",
+    columns: Optional[List[str]] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+) -> pd.DataFrame:
     """
-    Get safety detail data, optionally filtered by organization.
+    Get safety detail data, optionally filtered by organization and date.
     
     Args:
         orgname: Organization name to filter by (optional)
+        columns: Columns to load (all columns if None); "区域" and "date"
+            are always loaded for filtering and date parsing
+        date_range: Inclusive (start, end) publication dates; either end
+            may be None (optional)
         
     Returns:
         DataFrame containing safety details
     """
     beginwith = "safedtl"
-    pendf = get_csvdf(pensafe, beginwith)
-    
-    if orgname:
-        pendf = pendf[pendf["区域"] == orgname]
+    pendf = get_storage().read(
+        beginwith, columns, region=orgname or None, date_range=date_range
+    )
         
     if len(pendf) > 0:
-        pendf.loc[:, "发布日期"] = pendf["date"].apply(parse_date)
+        pendf = pendf.copy()
+        pendf["发布日期"], unparsed = parse_dates(pendf["date"])
+        note_unparsed_dates(beginwith, unparsed)
+        pendf = apply_schema(pendf)
 
     return pendf
 
 
+def _contains(series: pd.Series, text: str) -> pd.Series:
+    """
+    Match rows whose value contains text; an empty text matches every row.
+    
+    Args:
+        series: Text or categorical column
+        text: Keyword to search for
+        
+    Returns:
+        Boolean mask
+    """
+    if not text:
+        return pd.Series(True, index=series.index)
+    return series.astype(str).str.contains(text) & series.notna()
+
+
 def searchsafe(
     df: pd.DataFrame,
     start_date: pd.Timestamp,
@@ -61,13 +89,13 @@ def searchsafe(
         DataFrame with filtered search results
     """
     searchdf = df[
-        (df["发布日期"] >= start_date)
-        & (df["发布日期"] <= end_date)
-        & (df["违规主体名称"].str.contains(people_text))
-        & (df["行政处罚决定书文号"].str.contains(wenhao_text))
-        & (df["违法行为类型"].str.contains(event_text))
-        & (df["处罚内容"].str.contains(penalty_text))
-        & (df["作出处罚决定的行政机关名称"].str.contains(org_text))
+        (df["发布日期"] >= pd.Timestamp(start_date))
+        & (df["发布日期"] <= pd.Timestamp(end_date))
+        & _contains(df["违规主体名称"], people_text)
+        & _contains(df["行政处罚决定书文号"], wenhao_text)
+        & _contains(df["违法行为类型"], event_text)
+        & _contains(df["处罚内容"], penalty_text)
+        & _contains(df["作出处罚决定的行政机关名称"], org_text)
         & (df["区域"].isin(province))
         & (df["amount"] >= min_penalty)
     ]
@@ -6,14 +6,23 @@ from regulatory authorities.
 """
 import csv
 import os
-from typing import Dict, List, Tuple, Optional, Union
+from typing import Any, Dict, List, Tuple, Optional, Union
 
 import pandas as pd
 import streamlit as st
 
 from data_processing import get_safedetail
-from utils import get_csvdf, parse_date, savedf, get_now
-from visualization import display_search_df
+from utils import (
+    get_now,
+    get_unparsed_dates,
+    invalidate_csv_cache,
+    month_key,
+    note_unparsed_dates,
+    parse_dates,
+    savedf,
+)
+from schema import apply_schema
+from storage import get_storage
 
 
 # Constants
@@ -117,6 +126,9 @@ def display_eventdetail(search_df: pd.DataFrame) -> None:
     Args:
         search_df: DataFrame containing search results
     """
+    # visualization imports helpers from this module, so import it late
+    from visualization import display_search_df
+
     display_search_df(search_df)
     
     search_dfnew = st.session_state["search_result_safe"]
@@ -229,11 +241,11 @@ def display_summary() -> pd.DataFrame:
     Returns:
         DataFrame containing summary information by region
     """
-    oldsum2 = get_safedetail("")
+    oldsum2 = get_safedetail("", columns=["区域", "date"])
     oldlen2 = len(oldsum2)
     
-    min_date2 = oldsum2["发布日期"].min()
-    max_date2 = oldsum2["发布日期"].max()
+    min_date2 = oldsum2["发布日期"].min().date()
+    max_date2 = oldsum2["发布日期"].max().date()
     
     # Display metrics in columns
     col1, col2 = st.columns([1, 3])
@@ -244,12 +256,24 @@ def display_summary() -> pd.DataFrame:
 
     # Create and display summary by region
     sumdf2 = (
-        oldsum2.groupby("区域")["发布日期"].agg(["max", "min", "count"]).reset_index()
+        oldsum2.groupby("区域", observed=True)["发布日期"]
+        .agg(["max", "min", "count"])
+        .reset_index()
     )
     sumdf2.columns = ["区域", "最近发文日期", "最早发文日期", "案例总数"]
+    sumdf2["最近发文日期"] = sumdf2["最近发文日期"].dt.date
+    sumdf2["最早发文日期"] = sumdf2["最早发文日期"].dt.date
     sumdf2.sort_values(by=["最近发文日期"], ascending=False, inplace=True)
     sumdf2.reset_index(drop=True, inplace=True)
     
+    nodate = oldsum2["发布日期"].isna().sum()
+    if nodate > 0:
+        st.warning(f"{nodate}条案例发布日期无法解析")
+    unparsed = get_unparsed_dates().get("safedtl")
+    if unparsed:
+        with st.expander("无法解析的发布日期"):
+            st.table(pd.DataFrame(list(unparsed.items()), columns=["原始日期", "案例数"]))
+    
     st.markdown("#### 按区域统计")
     st.table(sumdf2)
 
@@ -268,33 +292,42 @@ def display_safesum(org_name_ls: List[str]) -> None:
         
         # Display list summary
         st.markdown("列表")
-        oldsum = get_safesum(org_name)
+        oldsum = get_safesum(org_name, columns=["link"])
         display_suminfo(oldsum)
         
         # Display detail summary
         st.markdown("详情")
-        dtl = get_safedetail(org_name)
+        dtl = get_safedetail(org_name, columns=["link", "违法事实"])
         dtl = dtl.dropna(subset=["违法事实"])
         display_suminfo(dtl)
 
 
-def get_safesum(orgname: str) -> pd.DataFrame:
+def get_safesum(
+    orgname: str,
+    columns: Optional[List[str]] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+) -> pd.DataFrame:
     """
     Get summary data for the specified organization.
     
     Args:
         orgname: Organization name to filter by
+        columns: Columns to load (all columns if None); "区域" and "date"
+            are always loaded for filtering and date parsing
+        date_range: Inclusive (start, end) publication dates; either end
+            may be None (optional)
         
     Returns:
         DataFrame containing summary data for the organization
     """
     beginwith = "safesum"
-    allpendf = get_csvdf(pensafe, beginwith)
-    pendf = allpendf[allpendf["区域"] == orgname]
+    pendf = get_storage().read(beginwith, columns, region=orgname, date_range=date_range)
     
     if len(pendf) > 0:
         pendf = pendf.copy()
-        pendf.loc[:, "发布日期"] = pendf["date"].apply(parse_date)
+        pendf["发布日期"], unparsed = parse_dates(pendf["date"])
+        note_unparsed_dates(beginwith, unparsed)
+        pendf = apply_schema(pendf)
     
     return pendf
 
@@ -309,8 +342,8 @@ def display_suminfo(df: pd.DataFrame) -> None:
     oldlen = len(df)
     if oldlen > 0:
         linkno = df["link"].nunique()
-        min_date = df["发布日期"].min()
-        max_date = df["发布日期"].max()
+        min_date = df["发布日期"].min().date()
+        max_date = df["发布日期"].max().date()
         
         # Display metrics in columns
         col1, col2, col3 = st.columns([1, 1, 1])
@@ -337,11 +370,15 @@ def savetempsub(df: pd.DataFrame, basename: str, subfolder: str) -> None:
     
     # Save with appropriate CSV options
     df.to_csv(savepath, quoting=csv.QUOTE_NONNUMERIC, escapechar="\\")
+    invalidate_csv_cache(savepath)
 
 
 def update_safelabel() -> None:
     """Update case labels with financial amount information."""
-    safedf = get_safedetail("")
+    safedf = get_safedetail(
+        "",
+        columns=["link", "违法事实", "罚款金额（万元）", "没收金额（万元）", "罚没款金额（万元）"],
+    )
     safedf = safedf.dropna(subset=["违法事实"])
     st.text(safedf.columns)
 
@@ -350,10 +387,8 @@ def update_safelabel() -> None:
         ["link", "罚款金额（万元）", "没收金额（万元）", "罚没款金额（万元）"]
     ]
     
-    # Fill NaN values and convert to float
+    # Amounts are already float32 from the case schema; fill missing values
     touptdf = touptdf.fillna(0)
-    for col in ["罚款金额（万元）", "没收金额（万元）", "罚没款金额（万元）"]:
-        touptdf[col] = touptdf[col].astype(float)
     
     # Calculate total amount
     touptdf["amount"] = (
@@ -384,16 +419,20 @@ def update_safelabel() -> None:
         st.info("无待更新分类数据")
 
 
-def get_safecat() -> pd.DataFrame:
+def get_safecat(columns: Optional[List[str]] = None) -> pd.DataFrame:
     """
     Get case category data.
     
+    Args:
+        columns: Columns to load (all columns if None); "amount" is always loaded
+    
     Returns:
         DataFrame containing case categories with amount information
     """
-    amtdf = get_csvdf(pensafe, "safecat")
-    amtdf["amount"] = amtdf["amount"].astype(float)
-    return amtdf
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + ["amount"]))
+    amtdf = get_storage().read("safecat", columns)
+    return apply_schema(amtdf)
 
 
 def sum_amount_by_month(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
@@ -408,8 +447,7 @@ def sum_amount_by_month(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     df1 = df.copy()
     df1["amount"] = df1["amount"].fillna(0)
-    df1["发布日期"] = pd.to_datetime(df1["发布日期"]).dt.date
-    df1["month"] = df1["发布日期"].apply(lambda x: x.strftime("%Y-%m"))
+    df1["month"] = month_key(df1["发布日期"])
     
     # Calculate monthly sums
     df_month_sum = df1.groupby(["month"])["amount"].sum().reset_index(name="sum")
@@ -0,0 +1,500 @@
+"""
+Plain-HTTP Page Fetcher for DBSafe
+
+The case list pages are static HTML tables, so they can be fetched with a
+pooled keep-alive requests.Session and parsed with lxml instead of a full
+browser page load. Callers fall back to Selenium only when a page comes
+back without a table element, i.e. when it needs JavaScript to render; a
+table without rows (e.g. a page past the end of the list) has no cases.
+
+Detail pages are fetched concurrently by a thread pool. Each host gets a
+limiter with a concurrency cap, a token-bucket request rate and jittered
+pacing, so throughput can be tuned per regional site in HOST_LIMITS.
+
+All requests go through the on-disk response cache (see httpcache.py):
+detail pages are reused for DETAIL_TTL, list pages are revalidated with a
+conditional request every time.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import lxml.html
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from httpcache import get_response_cache
+
+
+# HTTP settings
+HTTP_TIMEOUT = 15
+HTTP_POOL_SIZE = 10
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    ),
+    "Accept-Language": "zh-CN,zh;q=0.9",
+}
+
+# Seconds a cached page is used without revalidation: list pages change with
+# every new case, published detail pages practically never
+LIST_TTL = 0
+DETAIL_TTL = 30 * 24 * 3600
+
+# Columns of the list page table, in order
+LIST_COLUMNS = ["no", "name", "date", "doc"]
+
+# Total page count in the list pagination, e.g. "共120页", and page links
+PAGE_COUNT_PATTERN = re.compile(r"共\s*(\d+)\s*页")
+PAGE_LINK_PATTERN = re.compile(r"[?&]page=(\d+)")
+
+# Detail fetcher settings; the worker count can be set with DBSAFE_DETAIL_WORKERS
+DETAIL_WORKERS = int(os.environ.get("DBSAFE_DETAIL_WORKERS") or 4)
+
+# Default per-host limits: concurrent requests, requests per second, burst
+# size and the (min, max) seconds of random pause before each request
+HOST_CONCURRENCY = 2
+HOST_RATE = 0.5
+HOST_BURST = 2
+HOST_JITTER = (0.5, 2.0)
+
+# Per-host overrides of the defaults above, e.g.
+# {"www.safe.gov.cn": {"concurrency": 4, "rate": 2.0}}
+HOST_LIMITS: Dict[str, Dict[str, object]] = {}
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+_host_limiters: Dict[str, "HostLimiter"] = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Get the process-wide keep-alive HTTP session.
+
+    Connections are pooled per host and retried on transient server errors.
+
+    Returns:
+        Shared requests.Session
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry = Retry(
+                total=2,
+                backoff_factor=0.5,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["GET"],
+            )
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.headers.update(HTTP_HEADERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+    return _http_session
+
+
+def cell_text(element: lxml.html.HtmlElement) -> str:
+    """
+    Get the text of a table cell the way a browser renders it: lines
+    stripped, blank lines dropped.
+
+    Args:
+        element: lxml element
+
+    Returns:
+        Cell text
+    """
+    lines = [line.strip() for line in element.text_content().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def list_frame(cells: List[str], links: List[str], url: str) -> pd.DataFrame:
+    """
+    Build the no/name/date/link/doc frame from a list page's cells and links.
+
+    Args:
+        cells: Texts of the table cells, row by row
+        links: Absolute URLs of the table links, one per row
+        url: URL of the page, for error messages
+
+    Returns:
+        DataFrame with one row per case, empty if there are no rows
+
+    Raises:
+        ValueError: If the number of links does not match the number of rows
+    """
+    total = len(cells) // len(LIST_COLUMNS)
+    if total == 0:
+        return pd.DataFrame()
+    if len(links) != total:
+        raise ValueError(f"{len(links)} links for {total} rows: {url}")
+
+    data = {
+        col: cells[i :: len(LIST_COLUMNS)][:total] for i, col in enumerate(LIST_COLUMNS)
+    }
+    return pd.DataFrame(
+        {
+            "no": data["no"],
+            "name": data["name"],
+            "date": data["date"],
+            "link": links,
+            "doc": data["doc"],
+        }
+    )
+
+
+def parse_list_html(html: bytes, url: str) -> pd.DataFrame:
+    """
+    Parse a case list page into the no/name/date/link/doc frame.
+
+    Args:
+        html: Page content; the charset is taken from the page itself
+        url: URL the page was fetched from, used to resolve relative links
+
+    Returns:
+        DataFrame with one row per case, empty if the page has no table rows
+
+    Raises:
+        ValueError: If the number of links does not match the number of rows
+    """
+    tree = lxml.html.fromstring(html)
+    cells = [cell_text(td) for td in tree.xpath("//tbody//td")]
+    links = [urljoin(url, href) for href in tree.xpath("//tbody//a/@href")]
+
+    return list_frame(cells, links, url)
+
+
+def needs_javascript(html: bytes) -> bool:
+    """
+    Check whether a served page leaves its table to scripts.
+
+    A page with an empty table, such as a list page past the last page, is
+    complete as served and has no rows.
+
+    Args:
+        html: Page content
+
+    Returns:
+        True if the page has no table element
+    """
+    return not lxml.html.fromstring(html).xpath("//table")
+
+
+def parse_page_count(html: bytes) -> Optional[int]:
+    """
+    Read the total number of list pages from the pagination control.
+
+    The "共N页" label is used if present, otherwise the highest page number
+    linked from the page.
+
+    Args:
+        html: List page content
+
+    Returns:
+        Number of pages or None if the page has no pagination
+    """
+    tree = lxml.html.fromstring(html)
+    match = PAGE_COUNT_PATTERN.search(tree.text_content())
+    if match:
+        return int(match.group(1))
+
+    pages = [
+        int(page)
+        for href in tree.xpath("//a/@href")
+        for page in PAGE_LINK_PATTERN.findall(href)
+    ]
+    return max(pages) if pages else None
+
+
+def cached_html(url: str, ttl: float) -> Optional[bytes]:
+    """
+    Get a page from the response cache if it was fetched within the TTL.
+
+    Args:
+        url: Page URL
+        ttl: Maximum age in seconds
+
+    Returns:
+        Cached body or None
+    """
+    cache = get_response_cache()
+    entry = cache.get(url)
+    if entry is None or time.time() - entry["fetched"] >= ttl:
+        return None
+    body = cache.body(entry)
+    if body is not None:
+        cache.count("hits")
+    return body
+
+
+def fetch_html(
+    url: str, session: Optional[requests.Session] = None, ttl: float = LIST_TTL
+) -> bytes:
+    """
+    Fetch a page over HTTP through the response cache.
+
+    A cached copy younger than ttl is returned without a request; an older
+    one is revalidated with If-None-Match/If-Modified-Since and reused if
+    the server answers 304 Not Modified.
+
+    Args:
+        url: Page URL
+        session: HTTP session (shared session if None)
+        ttl: Seconds a cached copy is used without revalidation
+
+    Returns:
+        Response body
+
+    Raises:
+        requests.HTTPError: If the server returns an error status
+    """
+    body = cached_html(url, ttl)
+    if body is not None:
+        return body
+
+    session = session or get_http_session()
+    cache = get_response_cache()
+    entry = cache.get(url)
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    resp = session.get(url, timeout=HTTP_TIMEOUT, headers=headers)
+    if resp.status_code == 304 and entry is not None:
+        body = cache.body(entry)
+        if body is not None:
+            cache.touch(url, entry)
+            cache.count("revalidated")
+            return body
+        # Cached body lost; fetch the page again unconditionally
+        resp = session.get(url, timeout=HTTP_TIMEOUT)
+
+    resp.raise_for_status()
+    cache.put(url, resp.content, resp.headers)
+    cache.count("misses")
+    return resp.content
+
+
+def parse_detail_html(html: bytes) -> Dict[str, str]:
+    """
+    Parse a case detail page into header/cell pairs, as web2table does.
+
+    Args:
+        html: Page content; the charset is taken from the page itself
+
+    Returns:
+        Mapping of table header to cell text, empty if the page has no table
+    """
+    tree = lxml.html.fromstring(html)
+    headers = [cell_text(th) for th in tree.xpath("//body//th")]
+    cells = [cell_text(td) for td in tree.xpath("//body//td")]
+    return dict(zip(headers, cells))
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of requests."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Create a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens, i.e. the burst size
+        """
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, blocking until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    """Concurrency cap, rate limit and jittered pacing for one host."""
+
+    def __init__(
+        self,
+        concurrency: int = HOST_CONCURRENCY,
+        rate: float = HOST_RATE,
+        burst: float = HOST_BURST,
+        jitter: Tuple[float, float] = HOST_JITTER,
+    ):
+        """
+        Args:
+            concurrency: Maximum number of requests in flight
+            rate: Requests per second
+            burst: Requests that may be sent back to back after a pause
+            jitter: (min, max) seconds of random pause before each request
+        """
+        self.slots = threading.BoundedSemaphore(max(int(concurrency), 1))
+        self.bucket = TokenBucket(rate, burst)
+        self.jitter = jitter
+
+    @contextmanager
+    def slot(self) -> Iterator[float]:
+        """
+        Hold a request slot, waiting for a free slot, a token and the jitter.
+
+        Yields:
+            Seconds spent waiting for the slot
+        """
+        began = time.monotonic()
+        with self.slots:
+            self.bucket.acquire()
+            low, high = self.jitter
+            if high > 0:
+                time.sleep(random.uniform(low, high))
+            yield time.monotonic() - began
+
+
+def get_host_limiter(url: str) -> HostLimiter:
+    """
+    Get the limiter shared by all requests to the host of a URL.
+
+    Args:
+        url: Request URL
+
+    Returns:
+        HostLimiter configured from HOST_LIMITS or the defaults
+    """
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = HostLimiter(**HOST_LIMITS.get(host, {}))
+        return _host_limiters[host]
+
+
+def fetch_detail_html(url: str, session: Optional[requests.Session] = None) -> bytes:
+    """
+    Fetch one case detail page over HTTP within its host's limits.
+
+    Args:
+        url: Detail page URL
+        session: HTTP session (shared session if None)
+
+    Returns:
+        Page body
+    """
+    return fetch_limited(url, session, DETAIL_TTL)[0]
+
+
+def fetch_limited(
+    url: str,
+    session: Optional[requests.Session] = None,
+    ttl: float = LIST_TTL,
+    pace: Optional[Callable[[], float]] = None,
+) -> Tuple[bytes, float]:
+    """
+    Fetch a page through the response cache within its host's limits.
+
+    All regional list pages live on one host, so list updates running in
+    parallel share its limiter instead of each sending requests at its own
+    pace.
+
+    Args:
+        url: Page URL
+        session: HTTP session (shared session if None)
+        ttl: Seconds a cached copy is used without revalidation
+        pace: Called before a request goes out, e.g. a region pacer's pace;
+            returns the seconds it slept
+
+    Returns:
+        Tuple of (page body, seconds spent waiting for the pacing and the
+        host's limits)
+    """
+    # Cached pages do not count against the host's limits
+    html = cached_html(url, ttl) if ttl > 0 else None
+    waited = 0.0
+    if html is None:
+        paced = pace() if pace is not None else 0.0
+        with get_host_limiter(url).slot() as waited:
+            html = fetch_html(url, session, ttl)
+        waited += paced
+    return html, waited
+
+
+def _fetch_and_parse_detail(
+    url: str, pace: Optional[Callable[[], float]] = None
+) -> Tuple[Optional[bytes], Dict[str, str], Optional[Exception], float, float]:
+    """Fetch and parse one detail page; runs in the fetch_details threads."""
+    began = time.monotonic()
+    waited = 0.0
+    try:
+        html, waited = fetch_limited(url, ttl=DETAIL_TTL, pace=pace)
+        row = parse_detail_html(html)
+    except Exception as e:
+        return None, {}, e, time.monotonic() - began - waited, waited
+    return html, row, None, time.monotonic() - began - waited, waited
+
+
+def fetch_details(
+    urls: List[str],
+    max_workers: int = DETAIL_WORKERS,
+    pace: Optional[Callable[[], float]] = None,
+) -> Iterator[Tuple[str, Optional[bytes], Dict[str, str], Optional[Exception], float, float]]:
+    """
+    Fetch detail pages concurrently.
+
+    Results are yielded in the calling thread as they complete, so callers
+    can journal them and update the UI without touching the worker threads.
+
+    Args:
+        urls: Detail page URLs
+        max_workers: Number of worker threads across all hosts
+        pace: Called by the threads before each request goes out, e.g. a
+            region pacer's pace; returns the seconds it slept
+
+    Yields:
+        Tuples of (url, page body, header/cell pairs, error, seconds spent
+        fetching and parsing, seconds spent waiting for the pacing and the
+        host's limits);
+        the body is None and the pairs are empty when the fetch failed, and
+        the pairs are empty when the page needs JavaScript
+    """
+    if not urls:
+        return
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {executor.submit(_fetch_and_parse_detail, url, pace): url for url in urls}
+        try:
+            for future in as_completed(futures):
+                yield (futures[future], *future.result())
+        finally:
+            # The caller stopped early: drop the pages not started yet
+            for future in futures:
+                future.cancel()
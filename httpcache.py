@@ -0,0 +1,268 @@
+"""
+On-disk HTTP Response Cache for DBSafe
+
+Fetched pages are kept under ``temp/httpcache``: each body is gzipped and
+stored once under the SHA-256 of its content, and a small JSON entry per
+URL records the body digest, the ETag and Last-Modified validators and the
+fetch time. The fetcher serves an entry younger than the caller's TTL
+without touching the network and revalidates older entries with a
+conditional request, so repeated update runs download only pages that
+changed. The hit, revalidation and miss counts are saved in the cache
+folder, so the Streamlit page can show those of the crawl worker.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+
+# Folder holding the cached responses
+HTTP_CACHE_PATH = os.path.join("temp", "httpcache")
+
+# Seconds the entry count and size of the cache are reused before the
+# cache folder is scanned again
+CACHE_STATS_TTL = 60.0
+
+# File in the cache folder holding the outcome counts of all processes, and
+# the seconds between a process adding its new counts to it
+COUNTS_FILE = "counts.json"
+COUNTS_SAVE_INTERVAL = 15.0
+
+OUTCOMES = ("hits", "revalidated", "misses")
+
+_response_cache: Optional["ResponseCache"] = None
+_response_cache_lock = threading.Lock()
+
+
+def _digest(data: bytes) -> str:
+    """SHA-256 hex digest of some bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write a file through a temporary file in the same folder."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmppath, path)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+class ResponseCache:
+    """Content-addressed store of HTTP response bodies keyed by URL."""
+
+    def __init__(self, folder: str = HTTP_CACHE_PATH):
+        """
+        Args:
+            folder: Folder holding the cached responses
+        """
+        self.folder = folder
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self._unsaved = dict.fromkeys(OUTCOMES, 0)
+        self._saved_at = time.monotonic()
+        self._sizes: Optional[Dict[str, int]] = None
+        self._sizes_at = 0.0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, url: str) -> str:
+        key = _digest(url.encode("utf-8"))
+        return os.path.join(self.folder, "entries", key[:2], key + ".json")
+
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.folder, "bodies", digest[:2], digest + ".gz")
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the cache entry of a URL.
+
+        Args:
+            url: Page URL
+
+        Returns:
+            Entry with "url", "digest", "etag", "last_modified" and "fetched"
+            (epoch seconds), or None if the URL is not cached
+        """
+        try:
+            with open(self._entry_path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def body(self, entry: Dict[str, Any]) -> Optional[bytes]:
+        """
+        Read the body of a cache entry.
+
+        Args:
+            entry: Entry returned by get
+
+        Returns:
+            Response body or None if it is missing or damaged
+        """
+        try:
+            with gzip.open(self._body_path(entry["digest"]), "rb") as f:
+                return f.read()
+        except (OSError, EOFError, KeyError):
+            return None
+
+    def put(self, url: str, body: bytes, headers: Mapping[str, str]) -> Dict[str, Any]:
+        """
+        Store a response.
+
+        Args:
+            url: Page URL
+            body: Response body
+            headers: Response headers
+
+        Returns:
+            New cache entry
+        """
+        digest = _digest(body)
+        bodypath = self._body_path(digest)
+        added = {"entries": 0 if os.path.exists(self._entry_path(url)) else 1, "bytes": 0}
+        if not os.path.exists(bodypath):
+            data = gzip.compress(body)
+            _write_atomic(bodypath, data)
+            added["bytes"] = len(data)
+        with self._lock:
+            if self._sizes is not None:
+                for key, value in added.items():
+                    self._sizes[key] += value
+
+        entry = {
+            "url": url,
+            "digest": digest,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched": time.time(),
+        }
+        self._save_entry(url, entry)
+        return entry
+
+    def touch(self, url: str, entry: Dict[str, Any]) -> None:
+        """
+        Mark an entry as fetched now, after the server confirmed it unchanged.
+
+        Args:
+            url: Page URL
+            entry: Entry returned by get
+        """
+        entry = dict(entry, fetched=time.time())
+        self._save_entry(url, entry)
+
+    def _save_entry(self, url: str, entry: Dict[str, Any]) -> None:
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        _write_atomic(self._entry_path(url), data)
+
+    def count(self, outcome: str) -> None:
+        """
+        Count a cache outcome: "hits", "revalidated" or "misses".
+
+        The counts are added to the counts file at most every
+        COUNTS_SAVE_INTERVAL seconds; call save_counts at the end of a crawl.
+
+        Args:
+            outcome: Outcome name
+        """
+        with self._lock:
+            self.counts[outcome] += 1
+            self._unsaved[outcome] += 1
+            due = time.monotonic() - self._saved_at >= COUNTS_SAVE_INTERVAL
+        if due:
+            self.save_counts()
+
+    def _load_counts(self) -> Dict[str, int]:
+        """Read the saved outcome counts; zeros if there are none."""
+        counts = dict.fromkeys(OUTCOMES, 0)
+        try:
+            with open(os.path.join(self.folder, COUNTS_FILE), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return counts
+        for outcome in OUTCOMES:
+            counts[outcome] = int(saved.get(outcome, 0))
+        return counts
+
+    def save_counts(self) -> None:
+        """Add the outcomes counted since the last save to the counts file."""
+        with self._lock:
+            self._saved_at = time.monotonic()
+            if not any(self._unsaved.values()):
+                return
+            counts = self._load_counts()
+            for outcome, value in self._unsaved.items():
+                counts[outcome] += value
+            data = json.dumps(counts).encode("utf-8")
+            _write_atomic(os.path.join(self.folder, COUNTS_FILE), data)
+            self._unsaved = dict.fromkeys(OUTCOMES, 0)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the outcomes counted by all processes and the size of the cache.
+
+        The outcomes are the saved counts plus those of this process not yet
+        saved. The size comes from a scan of the cache folder at most
+        CACHE_STATS_TTL seconds old, plus what this process has stored since.
+
+        Returns:
+            Dictionary with "hits", "revalidated", "misses", "entries" and
+            "bytes" (compressed bodies on disk)
+        """
+        now = time.monotonic()
+        with self._lock:
+            stats = self._load_counts()
+            for outcome, value in self._unsaved.items():
+                stats[outcome] += value
+            sizes = self._sizes if now - self._sizes_at < CACHE_STATS_TTL else None
+            if sizes is not None:
+                stats.update(sizes)
+                return stats
+
+        sizes = self._scan()
+        with self._lock:
+            self._sizes = dict(sizes)
+            self._sizes_at = now
+        stats.update(sizes)
+        return stats
+
+    def _scan(self) -> Dict[str, int]:
+        """Count the entries and the bytes of the bodies in the cache folder."""
+        entries = 0
+        size = 0
+        for sub, suffix in (("entries", ".json"), ("bodies", ".gz")):
+            for root, _, files in os.walk(os.path.join(self.folder, sub)):
+                for name in files:
+                    if not name.endswith(suffix):
+                        continue
+                    if sub == "entries":
+                        entries += 1
+                    else:
+                        size += os.path.getsize(os.path.join(root, name))
+        return {"entries": entries, "bytes": size}
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Get the process-wide response cache.
+
+    Returns:
+        Shared ResponseCache
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,304 @@
+"""
+Crawl Job Queue for DBSafe
+
+List, detail and retry crawls run as jobs in a separate worker process
+(``python worker.py``) instead of inside the Streamlit script, so a page
+refresh or rerun no longer kills a crawl and the UI stays responsive. The
+Streamlit page enqueues jobs in an SQLite queue (``temp/jobs.db``) and
+polls the progress the worker records there: pages done out of pages
+planned, rows found, errors, the latest message and an ETA.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# Queue database
+JOBS_DB_PATH = os.path.join("temp", "jobs.db")
+
+# Job kinds and states
+JOB_KINDS = ("list", "detail", "retry")
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Counters a running job reports
+PROGRESS_FIELDS = ("pages_done", "pages_total", "rows", "errors")
+
+_job_queue: Optional["JobQueue"] = None
+_job_queue_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised in the worker when the running job has been cancelled."""
+
+
+class JobQueue:
+    """SQLite queue of crawl jobs and their progress."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        """
+        Open the queue, creating the database if needed.
+
+        Args:
+            path: Path of the SQLite database file
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL,
+                    updated REAL,
+                    worker INTEGER,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    pages_total INTEGER NOT NULL DEFAULT 0,
+                    rows INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    error TEXT
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+    def enqueue(self, kind: str, params: Dict[str, Any]) -> int:
+        """
+        Add a job to the queue.
+
+        Args:
+            kind: "list", "detail" or "retry"
+            params: Job parameters, e.g. the organizations and page range
+
+        Returns:
+            Job id
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}. Use one of {list(JOB_KINDS)}.")
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, params, state, created) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(params, ensure_ascii=False), QUEUED, time.time()),
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker: int) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest queued job and mark it running.
+
+        Args:
+            worker: Process id of the claiming worker
+
+        Returns:
+            Job or None if the queue is empty
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE state = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = ?, started = ?, updated = ?, worker = ? "
+                "WHERE id = ? AND state = ?",
+                (RUNNING, now, now, worker, row["id"], QUEUED),
+            )
+            if cursor.rowcount == 0:
+                return None
+        return self.get(row["id"])
+
+    def progress(self, job_id: int, message: Optional[str] = None, **counts: int) -> None:
+        """
+        Add to the counters of a running job and record its latest message.
+
+        Args:
+            job_id: Job id
+            message: Latest progress message (unchanged if None)
+            **counts: Increments of pages_done, pages_total, rows and errors
+
+        Raises:
+            JobCancelled: If the job has been cancelled
+        """
+        sets = ["updated = ?"]
+        params: List[Any] = [time.time()]
+        for field, value in counts.items():
+            if field not in PROGRESS_FIELDS:
+                raise ValueError(f"Unknown progress field: {field}")
+            sets.append(f"{field} = {field} + ?")
+            params.append(int(value))
+        if message is not None:
+            sets.append("message = ?")
+            params.append(message[:500])
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(sets)} WHERE id = ?", params + [job_id]
+            )
+            state = self._conn.execute(
+                "SELECT state FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if state is not None and state["state"] == CANCELLED:
+            raise JobCancelled(f"job {job_id} cancelled")
+
+    def finish(self, job_id: int, state: str = DONE, error: Optional[str] = None) -> None:
+        """
+        Mark a job as finished; a cancelled job stays cancelled.
+
+        Args:
+            job_id: Job id
+            state: "done" or "failed"
+            error: Error message of a failed job
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, finished = ?, updated = ?, error = ? "
+                "WHERE id = ? AND state != ?",
+                (state, now, now, error, job_id, CANCELLED),
+            )
+
+    def cancel(self, job_id: int) -> None:
+        """
+        Cancel a queued or running job; a running job stops at its next
+        progress report.
+
+        Args:
+            job_id: Job id
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, finished = ?, updated = ? WHERE id = ? AND state IN (?, ?)",
+                (CANCELLED, now, now, job_id, QUEUED, RUNNING),
+            )
+
+    def recover(self) -> int:
+        """
+        Requeue the running jobs whose worker process no longer exists.
+
+        Returns:
+            Number of requeued jobs
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, worker FROM jobs WHERE state = ?", (RUNNING,)
+            ).fetchall()
+            stale = [row["id"] for row in rows if not _pid_alive(row["worker"])]
+            for job_id in stale:
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, worker = NULL, message = ? WHERE id = ?",
+                    (QUEUED, "worker stopped; requeued", job_id),
+                )
+        return len(stale)
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a job.
+
+        Args:
+            job_id: Job id
+
+        Returns:
+            Job as a dictionary with decoded params, or None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else _job(row)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get the most recent jobs, newest first.
+
+        Args:
+            limit: Maximum number of jobs
+
+        Returns:
+            Jobs as dictionaries with decoded params
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_job(row) for row in rows]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+
+def _job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """Check whether a process exists."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def job_eta(job: Dict[str, Any], now: Optional[float] = None) -> Optional[float]:
+    """
+    Estimate the seconds a running job still needs from its page rate so far.
+
+    Args:
+        job: Job dictionary
+        now: Current time (time.time() if None)
+
+    Returns:
+        Seconds remaining or None if the job has no rate yet
+    """
+    if job["state"] != RUNNING or not job["started"] or job["pages_done"] <= 0:
+        return None
+    remaining = job["pages_total"] - job["pages_done"]
+    if remaining <= 0:
+        return None
+    elapsed = (now or time.time()) - job["started"]
+    return elapsed / job["pages_done"] * remaining
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Get the process-wide job queue.
+
+    Returns:
+        Shared JobQueue
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,128 @@
+"""
+Append-only Checkpoint Journal for DBSafe
+
+Scraping loops append each newly scraped batch of rows to a JSON Lines
+journal instead of re-concatenating and rewriting everything scraped so
+far, so a checkpoint costs the same on page 500 as on page 1. The journal
+is fsynced every few appends and can be replayed into a DataFrame at the
+end of a run or after a crash.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import json
+import os
+from typing import Any
+
+import pandas as pd
+
+
+# Number of appends between fsyncs
+JOURNAL_FSYNC_EVERY = 10
+
+
+class CheckpointJournal:
+    """JSON Lines journal of scraped rows, one JSON object per row."""
+
+    def __init__(self, path: str, fsync_every: int = JOURNAL_FSYNC_EVERY):
+        """
+        Open a journal for appending, creating its folder if needed.
+
+        Opening an existing journal continues it.
+
+        Args:
+            path: Path of the journal file
+            fsync_every: Number of appends between fsyncs (1 syncs every append)
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.fsync_every = max(fsync_every, 1)
+        self.pending = 0
+        self.rows = 0
+        self._file = open(path, "a", encoding="utf-8")
+
+        # Terminate a last line cut short by a crash so new rows start cleanly
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def append(self, df: pd.DataFrame) -> None:
+        """
+        Append the rows of a DataFrame.
+
+        Args:
+            df: Newly scraped rows
+        """
+        if not df.empty:
+            self._file.write(
+                df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n")
+                + "\n"
+            )
+            self.rows += len(df)
+        self._file.flush()
+
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        """Flush and fsync the journal to disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending = 0
+
+    def close(self) -> None:
+        """Sync and close the journal."""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def replay(self) -> pd.DataFrame:
+        """
+        Read back everything written to this journal.
+
+        Returns:
+            DataFrame of all journaled rows
+        """
+        if not self._file.closed:
+            self._file.flush()
+        return replay_journal(self.path)
+
+    def __enter__(self) -> "CheckpointJournal":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def replay_journal(path: str) -> pd.DataFrame:
+    """
+    Replay a journal file into a DataFrame.
+
+    A final line cut short by a crash is ignored.
+
+    Args:
+        path: Path of the journal file
+
+    Returns:
+        DataFrame of the journaled rows or empty DataFrame if there are none
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame()
+
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    if not records:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(records)
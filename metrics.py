@@ -0,0 +1,356 @@
+"""
+Crawl Metrics for DBSafe
+
+The scraper records every page fetch here: its latency, the bytes of the
+page body, the rows extracted, the error class of failed fetches and the
+time spent pausing between requests, broken down by region and page kind.
+Detail pages are fetched concurrently, so per-fetch times are also merged
+into the wall-clock time during which at least one fetch was in flight;
+the busy and idle shares are taken from that, not from the summed times.
+The counters are written as a Prometheus textfile (``temp/dbsafe.prom``,
+readable by the node_exporter textfile collector) and a JSON run summary
+(``temp/crawl_summary.json``) while a crawl runs and when it ends, so
+concurrency and pacing can be tuned against measured behaviour.
+
+Set DBSAFE_METRICS_DIR to write both files to another folder, e.g. the
+textfile collector directory.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Output files; the folder can be set with DBSAFE_METRICS_DIR
+METRICS_DIR = os.environ.get("DBSAFE_METRICS_DIR") or "temp"
+METRICS_TEXTFILE = "dbsafe.prom"
+METRICS_SUMMARY = "crawl_summary.json"
+
+# Upper bounds in seconds of the fetch latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Seconds between the files being rewritten during a crawl
+METRICS_FLUSH_INTERVAL = 15.0
+
+# Busy intervals ending this many seconds before the latest one are folded
+# into a running total
+BUSY_HORIZON = 300.0
+
+_metrics: Optional["CrawlMetrics"] = None
+_metrics_lock = threading.Lock()
+
+Key = Tuple[str, str]
+
+
+class _Spans:
+    """Union of time intervals: the wall-clock time covered by any of them."""
+
+    def __init__(self) -> None:
+        self.folded = 0.0
+        self.spans: List[List[float]] = []
+
+    def add(self, start: float, end: float) -> None:
+        merged = [start, end]
+        spans = []
+        for span in self.spans:
+            if span[1] < merged[0] or span[0] > merged[1]:
+                spans.append(span)
+            else:
+                merged = [min(span[0], merged[0]), max(span[1], merged[1])]
+        spans.append(merged)
+        spans.sort()
+        while spans and spans[0][1] < end - BUSY_HORIZON:
+            span = spans.pop(0)
+            self.folded += span[1] - span[0]
+        self.spans = spans
+
+    def total(self) -> float:
+        return self.folded + sum(end - start for start, end in self.spans)
+
+
+def _new_series() -> Dict[str, Any]:
+    return {
+        "requests": 0,
+        "bytes": 0,
+        "rows": 0,
+        "sleep_seconds": 0.0,
+        "latency_sum": 0.0,
+        "latency_max": 0.0,
+        "buckets": [0] * len(LATENCY_BUCKETS),
+        "errors": {},
+        "busy": _Spans(),
+        "first": None,
+        "last": None,
+    }
+
+
+def _extend(series: Dict[str, Any], start: float, end: float) -> None:
+    """Widen the wall-clock span of a series to an interval."""
+    if series["first"] is None or start < series["first"]:
+        series["first"] = start
+    if series["last"] is None or end > series["last"]:
+        series["last"] = end
+
+
+def _write_atomic(path: str, text: str) -> None:
+    """Write a text file through a temporary file in the same folder."""
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmppath, path)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+def _label(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _quantile(series: Dict[str, Any], q: float) -> Optional[float]:
+    """Estimate a latency quantile as the upper bound of its histogram bucket."""
+    if series["requests"] == 0:
+        return None
+    rank = q * series["requests"]
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS, series["buckets"]):
+        seen += count
+        if seen >= rank:
+            return min(bound, series["latency_max"])
+    return series["latency_max"]
+
+
+class CrawlMetrics:
+    """Thread-safe fetch counters per region and page kind."""
+
+    def __init__(self, folder: str = METRICS_DIR):
+        """
+        Args:
+            folder: Folder the textfile and the run summary are written to
+        """
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._series: Dict[Key, Dict[str, Any]] = {}
+        self.started = time.time()
+        self._flushed = time.monotonic()
+
+    def reset(self) -> None:
+        """Clear the counters and start a new run."""
+        with self._lock:
+            self._series = {}
+            self.started = time.time()
+
+    def _get(self, region: str, kind: str) -> Dict[str, Any]:
+        key = (region, kind)
+        if key not in self._series:
+            self._series[key] = _new_series()
+        return self._series[key]
+
+    def fetch(
+        self,
+        region: str,
+        kind: str,
+        seconds: float,
+        nbytes: int = 0,
+        rows: int = 0,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        Record one page fetch.
+
+        Args:
+            region: Region index (see dbsafe.org2name)
+            kind: "list" or "detail"
+            seconds: Time spent fetching and parsing the page, ending now
+            nbytes: Size of the page body
+            rows: Rows extracted from the page
+            error: Exception raised by the fetch, if it failed
+        """
+        end = time.monotonic()
+        with self._lock:
+            series = self._get(region, kind)
+            series["requests"] += 1
+            series["bytes"] += int(nbytes)
+            series["rows"] += int(rows)
+            series["busy"].add(end - seconds, end)
+            _extend(series, end - seconds, end)
+            series["latency_sum"] += seconds
+            series["latency_max"] = max(series["latency_max"], seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+                    break
+            if error is not None:
+                name = type(error).__name__
+                series["errors"][name] = series["errors"].get(name, 0) + 1
+        self.flush()
+
+    def sleep(self, region: str, kind: str, seconds: float) -> None:
+        """
+        Record time spent pausing between requests.
+
+        Args:
+            region: Region index (see dbsafe.org2name)
+            kind: "list" or "detail"
+            seconds: Seconds slept, ending now
+        """
+        end = time.monotonic()
+        with self._lock:
+            series = self._get(region, kind)
+            series["sleep_seconds"] += seconds
+            _extend(series, end - seconds, end)
+        self.flush()
+
+    def _snapshot(self) -> Tuple[float, Dict[Key, Dict[str, Any]]]:
+        with self._lock:
+            series = {}
+            for key, s in self._series.items():
+                wall = 0.0 if s["first"] is None else s["last"] - s["first"]
+                series[key] = dict(
+                    s,
+                    buckets=list(s["buckets"]),
+                    errors=dict(s["errors"]),
+                    busy=s["busy"].total(),
+                    wall=wall,
+                )
+            return self.started, series
+
+    def render(self) -> str:
+        """
+        Render the counters in the Prometheus text exposition format.
+
+        Returns:
+            Textfile content
+        """
+        started, series = self._snapshot()
+        lines: List[str] = [
+            "# HELP dbsafe_crawl_start_time_seconds Start of the crawl run.",
+            "# TYPE dbsafe_crawl_start_time_seconds gauge",
+            f"dbsafe_crawl_start_time_seconds {started:.3f}",
+        ]
+
+        counters = [
+            ("dbsafe_fetch_bytes_total", "Bytes of fetched page bodies.", "bytes"),
+            ("dbsafe_rows_total", "Rows extracted from fetched pages.", "rows"),
+            (
+                "dbsafe_busy_seconds_total",
+                "Wall-clock seconds with at least one fetch in flight.",
+                "busy",
+            ),
+            (
+                "dbsafe_sleep_seconds_total",
+                "Seconds spent pausing between requests, summed over threads.",
+                "sleep_seconds",
+            ),
+            (
+                "dbsafe_wall_seconds_total",
+                "Wall-clock seconds from the first to the last fetch or pause.",
+                "wall",
+            ),
+        ]
+        for name, text, field in counters:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} counter")
+            for (region, kind), s in sorted(series.items()):
+                lines.append(f'{name}{{region="{_label(region)}",kind="{kind}"}} {s[field]}')
+
+        name = "dbsafe_fetch_errors_total"
+        lines.append(f"# HELP {name} Failed page fetches by error class.")
+        lines.append(f"# TYPE {name} counter")
+        for (region, kind), s in sorted(series.items()):
+            for error, count in sorted(s["errors"].items()):
+                lines.append(
+                    f'{name}{{region="{_label(region)}",kind="{kind}",error="{_label(error)}"}} {count}'
+                )
+
+        name = "dbsafe_fetch_seconds"
+        lines.append(f"# HELP {name} Page fetch latency; the sum adds up concurrent fetches.")
+        lines.append(f"# TYPE {name} histogram")
+        for (region, kind), s in sorted(series.items()):
+            labels = f'region="{_label(region)}",kind="{kind}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, s["buckets"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {s["requests"]}')
+            lines.append(f"{name}_sum{{{labels}}} {s['latency_sum']}")
+            lines.append(f"{name}_count{{{labels}}} {s['requests']}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the run per region and page kind.
+
+        Times ending in "_sum" add up the fetches or pauses of all threads and
+        can exceed the wall-clock time; the shares are taken from wall-clock
+        time: busy_share is the part with at least one fetch in flight,
+        idle_share the rest (pauses, limiter waits and bookkeeping).
+
+        Returns:
+            Dictionary with the run's start and end times and, per region and
+            kind, the request, byte, row and error counts, latency estimates
+            and the wall-clock busy and idle shares
+        """
+        started, series = self._snapshot()
+        regions: Dict[str, Dict[str, Any]] = {}
+        for (region, kind), s in sorted(series.items()):
+            requests = s["requests"]
+            wall = s["wall"]
+            regions.setdefault(region, {})[kind] = {
+                "requests": requests,
+                "bytes": s["bytes"],
+                "rows": s["rows"],
+                "errors": sum(s["errors"].values()),
+                "errors_by_type": s["errors"],
+                "latency_mean": s["latency_sum"] / requests if requests else None,
+                "latency_p50": _quantile(s, 0.5),
+                "latency_p95": _quantile(s, 0.95),
+                "latency_max": s["latency_max"],
+                "fetch_seconds_sum": round(s["latency_sum"], 3),
+                "sleep_seconds_sum": round(s["sleep_seconds"], 3),
+                "busy_seconds": round(s["busy"], 3),
+                "wall_seconds": round(wall, 3),
+                "busy_share": min(s["busy"] / wall, 1.0) if wall else None,
+                "idle_share": max(1.0 - s["busy"] / wall, 0.0) if wall else None,
+            }
+        return {"started": started, "updated": time.time(), "regions": regions}
+
+    def write(self) -> None:
+        """Write the Prometheus textfile and the JSON run summary."""
+        _write_atomic(os.path.join(self.folder, METRICS_TEXTFILE), self.render())
+        _write_atomic(
+            os.path.join(self.folder, METRICS_SUMMARY),
+            json.dumps(self.summary(), ensure_ascii=False, indent=2),
+        )
+        self._flushed = time.monotonic()
+
+    def flush(self) -> None:
+        """Write the files if they have not been written for a while."""
+        if time.monotonic() - self._flushed >= METRICS_FLUSH_INTERVAL:
+            self.write()
+
+
+def get_metrics() -> CrawlMetrics:
+    """
+    Get the process-wide crawl metrics.
+
+    Returns:
+        Shared CrawlMetrics
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = CrawlMetrics()
+        return _metrics
@@ -0,0 +1,220 @@
+"""
+Adaptive Crawl Pacing for DBSafe
+
+The delay between requests to a regional site is learned from how the site
+responds instead of being drawn from a fixed range. Each region's pacer
+follows AIMD: every healthy, fast response shortens the delay by a fixed
+step, while an error, an empty table or a slow response multiplies it. The
+delay stays between a floor and a ceiling, and the learned delays are
+persisted to ``temp/pacing.json`` every few updates and at the end of a
+job, so the next run starts at the pace the site tolerated last time.
+
+Sequential crawls sleep for the delay after each page (``wait``); the
+concurrent detail fetcher spaces the starts of its requests by the delay
+across all its threads (``pace``).
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+
+# File holding the learned delay of each region
+PACING_PATH = os.path.join("temp", "pacing.json")
+
+# Delay bounds and the starting delay of a region without history, in seconds
+PACE_FLOOR = 1.0
+PACE_CEILING = 60.0
+PACE_INITIAL = 5.0
+
+# AIMD parameters: seconds removed after a healthy response, factor applied
+# after a failure, and the latency above which a response counts as slow
+PACE_STEP = 0.5
+PACE_BACKOFF = 2.0
+PACE_SLOW_LATENCY = 5.0
+
+# Relative random spread applied to each wait
+PACE_JITTER = 0.2
+
+# Delay updates of a region between writes of the pacing state file
+PACE_SAVE_EVERY = 20
+
+_pacers: Dict[str, "AdaptivePacer"] = {}
+_pacing_state: Optional[Dict[str, float]] = None
+_pacing_lock = threading.Lock()
+
+
+class AdaptivePacer:
+    """AIMD delay between the requests of one region."""
+
+    def __init__(
+        self,
+        key: str,
+        delay: float = PACE_INITIAL,
+        floor: float = PACE_FLOOR,
+        ceiling: float = PACE_CEILING,
+        path: str = PACING_PATH,
+    ):
+        """
+        Args:
+            key: Region index the delay is learned for
+            delay: Starting delay in seconds
+            floor: Smallest delay in seconds
+            ceiling: Largest delay in seconds
+            path: Pacing state file
+        """
+        self.key = key
+        self.path = path
+        self.floor = floor
+        self.ceiling = ceiling
+        self.delay = min(max(delay, floor), ceiling)
+        self._next_at = 0.0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self, latency: Optional[float] = None, error: bool = False, empty: bool = False
+    ) -> float:
+        """
+        Adjust the delay after a request.
+
+        The delay is persisted every PACE_SAVE_EVERY updates; save_pacing
+        writes the latest delays at the end of a job.
+
+        Args:
+            latency: Seconds the request took (optional)
+            error: The request failed
+            empty: The page came back without table rows
+
+        Returns:
+            New delay in seconds
+        """
+        slow = latency is not None and latency > PACE_SLOW_LATENCY
+        with self._lock:
+            if error or empty or slow:
+                self.delay = min(self.delay * PACE_BACKOFF, self.ceiling)
+            else:
+                self.delay = max(self.delay - PACE_STEP, self.floor)
+            delay = self.delay
+            self._unsaved += 1
+            due = self._unsaved >= PACE_SAVE_EVERY
+            if due:
+                self._unsaved = 0
+        if due:
+            save_delay(self.key, delay, self.path)
+        return delay
+
+    def wait(self) -> float:
+        """
+        Sleep for the current delay with a small random spread.
+
+        Returns:
+            Seconds slept
+        """
+        seconds = self.delay * random.uniform(1 - PACE_JITTER, 1 + PACE_JITTER)
+        time.sleep(seconds)
+        return seconds
+
+    def pace(self) -> float:
+        """
+        Sleep until the next request of the region may start.
+
+        Safe to call from concurrent threads: each call reserves the next
+        start time, one jittered delay after the previous one, so the
+        region's requests are spaced by the delay however many threads
+        send them.
+
+        Returns:
+            Seconds slept
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_at, now)
+            self._next_at = start + self.delay * random.uniform(1 - PACE_JITTER, 1 + PACE_JITTER)
+        seconds = start - now
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+
+def _load_state(path: str) -> Dict[str, float]:
+    """Read the persisted delays, ignoring a missing or damaged file."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return {key: float(value) for key, value in json.load(f).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def save_delay(key: str, delay: float, path: str = PACING_PATH) -> None:
+    """
+    Persist the delay of a region.
+
+    Args:
+        key: Region index
+        delay: Delay in seconds
+        path: Pacing state file
+    """
+    global _pacing_state
+    with _pacing_lock:
+        if _pacing_state is None:
+            _pacing_state = _load_state(path)
+        _pacing_state[key] = round(delay, 3)
+        _write_state(_pacing_state, path)
+
+
+def save_pacing(path: str = PACING_PATH) -> None:
+    """
+    Persist the current delay of every region paced by this process.
+
+    Args:
+        path: Pacing state file
+    """
+    global _pacing_state
+    with _pacing_lock:
+        if not _pacers:
+            return
+        if _pacing_state is None:
+            _pacing_state = _load_state(path)
+        for key, pacer in _pacers.items():
+            _pacing_state[key] = round(pacer.delay, 3)
+        _write_state(_pacing_state, path)
+
+
+def _write_state(state: Dict[str, float], path: str) -> None:
+    """Write the pacing state file through a temporary file."""
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmppath = path + ".tmp"
+    with open(tmppath, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmppath, path)
+
+
+def get_pacer(key: str, path: str = PACING_PATH) -> AdaptivePacer:
+    """
+    Get the process-wide pacer of a region, starting at its persisted delay.
+
+    Args:
+        key: Region index
+        path: Pacing state file
+
+    Returns:
+        AdaptivePacer shared by all crawls of the region
+    """
+    global _pacing_state
+    with _pacing_lock:
+        if key not in _pacers:
+            if _pacing_state is None:
+                _pacing_state = _load_state(path)
+            _pacers[key] = AdaptivePacer(key, _pacing_state.get(key, PACE_INITIAL), path=path)
+        return _pacers[key]
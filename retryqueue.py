@@ -0,0 +1,283 @@
+"""
+Persistent Retry Queue for DBSafe
+
+List pages and detail links that fail during a crawl are recorded in an
+SQLite queue (``temp/retry.db``) with the error class, the number of
+attempts and the time the next attempt is due. Each failure pushes the
+next attempt back exponentially; after RETRY_MAX_ATTEMPTS failures the
+entry is moved to the dead-letter state and left for an operator. The
+retry driver in scraper.py re-fetches the due entries, so transient
+failures during a large backfill heal without re-running a whole region.
+
+Run ``python retryqueue.py`` to list the queue and ``--revive`` to give
+dead entries a new round of attempts.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# Queue database
+RETRY_DB_PATH = os.path.join("temp", "retry.db")
+
+# Attempts before an entry is dead-lettered; set with DBSAFE_RETRY_ATTEMPTS
+RETRY_MAX_ATTEMPTS = int(os.environ.get("DBSAFE_RETRY_ATTEMPTS") or 6)
+
+# Delay before the first retry, doubled after every failure up to the maximum
+RETRY_BASE_DELAY = 60.0
+RETRY_MAX_DELAY = 6 * 3600.0
+
+# Entry states
+PENDING = "pending"
+DONE = "done"
+DEAD = "dead"
+
+_retry_queue: Optional["RetryQueue"] = None
+_retry_queue_lock = threading.Lock()
+
+
+def backoff_delay(attempts: int) -> float:
+    """
+    Delay before the next attempt after a number of failed attempts.
+
+    Args:
+        attempts: Failed attempts so far (at least 1)
+
+    Returns:
+        Delay in seconds, with +/-20% jitter
+    """
+    delay = min(RETRY_BASE_DELAY * 2 ** (max(attempts, 1) - 1), RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class RetryQueue:
+    """SQLite queue of failed pages awaiting another attempt."""
+
+    def __init__(self, path: str = RETRY_DB_PATH, max_attempts: int = RETRY_MAX_ATTEMPTS):
+        """
+        Open the queue, creating the database if needed.
+
+        Args:
+            path: Path of the SQLite database file
+            max_attempts: Attempts before an entry is dead-lettered
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS retry (
+                    url TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    orgname TEXT NOT NULL,
+                    region TEXT NOT NULL,
+                    meta TEXT,
+                    error_class TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_at REAL NOT NULL,
+                    state TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS retry_due ON retry (state, next_at)"
+            )
+
+    def add(
+        self, url: str, kind: str, orgname: str, region: str, error: BaseException, **meta: Any
+    ) -> str:
+        """
+        Record a failed attempt and schedule the next one.
+
+        Args:
+            url: Page URL
+            kind: "list" or "detail"
+            orgname: Organization name
+            region: Region index (see dbsafe.org2name)
+            error: Exception raised by the attempt
+            **meta: Fields needed to redo the page, e.g. the list date of a
+                detail link
+
+        Returns:
+            New state of the entry: "pending" or "dead"
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts, state FROM retry WHERE url = ?", (url,)
+            ).fetchone()
+            attempts = 1 if row is None or row["state"] == DONE else row["attempts"] + 1
+            state = DEAD if attempts >= self.max_attempts else PENDING
+            self._conn.execute(
+                """
+                INSERT INTO retry
+                    (url, kind, orgname, region, meta, error_class, error,
+                     attempts, next_at, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    kind = excluded.kind, orgname = excluded.orgname,
+                    region = excluded.region, meta = excluded.meta,
+                    error_class = excluded.error_class, error = excluded.error,
+                    attempts = excluded.attempts, next_at = excluded.next_at,
+                    state = excluded.state, updated = excluded.updated
+                """,
+                (
+                    url,
+                    kind,
+                    orgname,
+                    region,
+                    json.dumps(meta, ensure_ascii=False, default=str),
+                    type(error).__name__,
+                    str(error)[:500],
+                    attempts,
+                    now + backoff_delay(attempts),
+                    state,
+                    now,
+                ),
+            )
+        return state
+
+    def done(self, url: str) -> None:
+        """
+        Mark a page as fetched; unknown URLs are ignored.
+
+        Args:
+            url: Page URL
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE retry SET state = ?, updated = ? WHERE url = ? AND state != ?",
+                (DONE, time.time(), url, DONE),
+            )
+
+    def due(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get the pending entries whose next attempt is due, oldest first.
+
+        Args:
+            limit: Maximum number of entries (all if None)
+
+        Returns:
+            Entries as dictionaries, with the meta fields merged in
+        """
+        sql = "SELECT * FROM retry WHERE state = ? AND next_at <= ? ORDER BY next_at"
+        params: List[Any] = [PENDING, time.time()]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def entries(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the entries in a state.
+
+        Args:
+            state: "pending", "done" or "dead" (all states if None)
+
+        Returns:
+            Entries as dictionaries, with the meta fields merged in
+        """
+        with self._lock:
+            if state is None:
+                rows = self._conn.execute("SELECT * FROM retry ORDER BY updated").fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM retry WHERE state = ? ORDER BY updated", (state,)
+                ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        meta = json.loads(entry.pop("meta") or "{}")
+        return {**meta, **entry}
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count the entries by state.
+
+        Returns:
+            Dictionary with the number of pending, done and dead entries
+        """
+        counts = {PENDING: 0, DONE: 0, DEAD: 0}
+        with self._lock:
+            for state, count in self._conn.execute(
+                "SELECT state, COUNT(*) FROM retry GROUP BY state"
+            ):
+                counts[state] = count
+        return counts
+
+    def revive(self) -> int:
+        """
+        Give the dead entries a new round of attempts, due now.
+
+        Returns:
+            Number of revived entries
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE retry SET state = ?, attempts = 0, next_at = ?, updated = ? "
+                "WHERE state = ?",
+                (PENDING, now, now, DEAD),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+
+def get_retry_queue() -> RetryQueue:
+    """
+    Get the process-wide retry queue.
+
+    Returns:
+        Shared RetryQueue
+    """
+    global _retry_queue
+    with _retry_queue_lock:
+        if _retry_queue is None:
+            _retry_queue = RetryQueue()
+        return _retry_queue
+
+
+def main() -> None:
+    """Command line entry point for the retry queue."""
+    parser = argparse.ArgumentParser(description="DBSafe retry queue")
+    parser.add_argument("--path", default=RETRY_DB_PATH, help="queue database")
+    parser.add_argument("--revive", action="store_true", help="retry dead entries again")
+    args = parser.parse_args()
+
+    queue = RetryQueue(args.path)
+    if args.revive:
+        print(f"revived {queue.revive()} entries")
+    for state, count in queue.counts().items():
+        print(f"{state}: {count}")
+    for entry in queue.entries(DEAD):
+        print(f"dead after {entry['attempts']} attempts: {entry['url']} ({entry['error_class']})")
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()
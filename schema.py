@@ -0,0 +1,108 @@
+"""
+Case Frame Schema for DBSafe
+
+This module declares the dtypes applied to the case frames at load time:
+categoricals for the low-cardinality text fields, float32 for the penalty
+amounts and datetime64 for the publication date. Every other column is
+left as text.
+
+Run ``python schema.py`` to print a memory report of the detail frame
+before and after the schema is applied.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+from typing import Dict
+
+import pandas as pd
+
+
+# Repeated values: region, penalty type and deciding authority
+CATEGORY_COLUMNS = ["区域", "处罚类别", "作出处罚决定的行政机关名称"]
+
+# Penalty amounts in 万元
+AMOUNT_COLUMNS = ["罚款金额（万元）", "没收金额（万元）", "罚没款金额（万元）", "amount"]
+
+# Parsed publication date
+DATE_COLUMNS = ["发布日期"]
+
+CASE_SCHEMA: Dict[str, str] = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    **{col: "float32" for col in AMOUNT_COLUMNS},
+    **{col: "datetime64[ns]" for col in DATE_COLUMNS},
+}
+
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, str] = CASE_SCHEMA) -> pd.DataFrame:
+    """
+    Convert the columns of a case frame to their declared dtypes.
+
+    Amounts and dates that cannot be parsed become NaN/NaT. Columns not in
+    the frame are skipped.
+
+    Args:
+        df: Case DataFrame
+        schema: Mapping of column name to dtype
+
+    Returns:
+        DataFrame with the declared dtypes applied
+    """
+    df = df.copy()
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith("float"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+        elif dtype.startswith("datetime64"):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def memory_report(df: pd.DataFrame, schema: Dict[str, str] = CASE_SCHEMA) -> pd.DataFrame:
+    """
+    Compare the memory used by a case frame before and after the schema.
+
+    Args:
+        df: Case DataFrame as loaded, before the schema is applied
+        schema: Mapping of column name to dtype
+
+    Returns:
+        DataFrame indexed by column (plus a "total" row) with the bytes
+        before and after and the dtype after
+    """
+    typed = apply_schema(df, schema)
+    report = pd.DataFrame(
+        {
+            "before": df.memory_usage(deep=True, index=False),
+            "after": typed.memory_usage(deep=True, index=False),
+            "dtype": typed.dtypes.astype(str),
+        }
+    )
+    report.loc["total"] = [report["before"].sum(), report["after"].sum(), ""]
+    return report
+
+
+def main() -> None:
+    """Print the memory report of the detail frame."""
+    from storage import get_storage
+    from utils import parse_date
+
+    df = get_storage().read("safedtl")
+    if df.empty:
+        print("no detail data")
+        return
+    # Dates as date objects, the representation used before the schema
+    df["发布日期"] = df["date"].apply(parse_date)
+
+    report = memory_report(df)
+    before = report.loc["total", "before"]
+    after = report.loc["total", "after"]
+    print(report.to_string())
+    print(f"{len(df)} rows: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,32 @@
+import os
+import queue
+import threading
 import time
-import random
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
 import pandas as pd
 import streamlit as st
 from selenium.webdriver.common.by import By
 
-from snapshot import get_chrome_driver, get_safari_driver
+from snapshot import borrow_driver, extract_table
 from utils import get_csvdf, get_now, savedf
 from data_processing import get_safedetail
+from storage import get_storage
+from session import CrawlSession
+from pacer import get_pacer
+from archive import get_archive
+from retryqueue import get_retry_queue
+from metrics import get_metrics
+from fetcher import (
+    fetch_detail_html,
+    fetch_details,
+    fetch_limited,
+    list_frame,
+    needs_javascript,
+    parse_detail_html,
+    parse_list_html,
+    parse_page_count,
+)
 
 
 # Constants
@@ -14,96 +34,180 @@ baseurl = "http://www.safe.gov.cn/www/illegal/index?page="
 pensafe = "safe"
 temppath = "temp"
 
+# Log level of structured progress: the message is a dict of increments of
+# "pages_done", "pages_total", "rows" and "errors"
+COUNTS = "counts"
+
+# Regions crawled at once by update_lists_parallel; set with DBSAFE_REGION_WORKERS
+REGION_WORKERS = int(os.environ.get("DBSAFE_REGION_WORKERS") or 4)
+
+# Browser rendering the detail pages the HTTP fetcher cannot parse; set with
+# DBSAFE_DETAIL_BROWSER ("LeanChrome", "Chrome" or "Safari")
+DETAIL_BROWSER = os.environ.get("DBSAFE_DETAIL_BROWSER") or "LeanChrome"
+
 
 # Import after constant definitions to avoid circular imports
 from dbsafe import org2name, savetempsub, get_safesum
 
 
-def get_sumeventdf(orgname, start, end):
+def list_url(org_name_index, page):
+    """
+    Build the URL of a region's event list page.
+
+    Args:
+        org_name_index: Region index (see dbsafe.org2name)
+        page: Page number
+
+    Returns:
+        List page URL
+    """
+    return baseurl + str(page) + "&siteid=" + org_name_index
+
+
+def st_log(level, message):
+    """
+    Write a progress message to the Streamlit page.
+
+    Args:
+        level: Streamlit message function, e.g. "info" or "error"; COUNTS
+            messages are not shown
+        message: Message text
+    """
+    if level == COUNTS:
+        return
+    getattr(st, level)(message)
+
+
+def page_bytes(html):
+    """
+    Size of a page body in bytes.
+
+    Args:
+        html: Page body as fetched, or page source text from the browser
+
+    Returns:
+        Number of bytes
+    """
+    return len(html.encode("utf-8") if isinstance(html, str) else html)
+
+
+class CrawlStopped(Exception):
+    """Raised in a region worker when update_lists_parallel is stopping."""
+
+
+def get_list_page(browser, url):
+    """
+    Scrape one event list page with the browser.
+
+    Args:
+        browser: Selenium WebDriver
+        url: List page URL
+
+    Returns:
+        DataFrame containing the page's event summaries
+    """
+    browser.implicitly_wait(3)
+    browser.get(url)
+
+    # Wait for the table to render, then read it in one round trip
+    browser.find_elements(By.CSS_SELECTOR, "tbody td")
+    table = extract_table(browser, cell_selector="tbody td", link_selector="tbody a")
+    return list_frame(table["cells"], table["links"], url)
+
+
+def get_sumeventdf(orgname, start, end, log=None):
     """
     Scrape event summary data for a given organization across a range of pages.
+
+    Pages are fetched over plain HTTP; the browser is only started for pages
+    whose table is not in the served HTML.
     
     Args:
         orgname: Name of the organization to scrape
         start: Starting page number
         end: Ending page number
+        log: Progress callback taking a Streamlit message level and text
+            (writes to the page if None)
         
     Returns:
         DataFrame containing scraped event summaries
     """
+    log = log or st_log
     org_name_index = org2name[orgname]
-    browser = get_chrome_driver(temppath)
+    browser = None
     cityname = org_name_index
 
-    resultls = []
+    # Scraped pages are journaled; a crashed run from the same start page
+    # resumes, whatever end page the planner chose this time
+    session = CrawlSession("list", org_name_index, {"start": start})
+    journal = session.journal
+    pacer = get_pacer(org_name_index)
+    archive = get_archive()
+    retryq = get_retry_queue()
+    metrics = get_metrics()
+    if session.resumed:
+        log("info", f"继续未完成的列表更新：已完成{len(session.done_pages)}页")
+    pages = [n for n in range(start, end + 1) if n not in session.done_pages]
+    log(COUNTS, {"pages_total": len(pages)})
+
     errorls = []
     count = 0
-    
-    for n in range(start, end + 1):
-        st.info(f"page: {n}")
-        st.info(f"{count} begin")
-        url = baseurl + str(n) + "&siteid=" + cityname
-        st.info(f"url: {url}")
+
+    # A pooled browser is borrowed for the first page that needs one
+    with ExitStack() as drivers:
+        for n in pages:
+            log("info", f"page: {n}")
+            log("info", f"{count} begin")
+            url = list_url(cityname, n)
+            log("info", f"url: {url}")
         
-        try:
-            browser.implicitly_wait(3)
-            browser.get(url)
-            
-            ls1 = browser.find_elements(By.XPATH, "//tbody//td")
-            nols = []
-            namels = []
-            datels = []
-            docls = []
-            total = len(ls1) // 4
+            began = time.monotonic()
+            waited = 0.0
+            try:
+                # Regions crawled in parallel share the list host's limiter
+                html, waited = fetch_limited(url)
+                pandf = parse_list_html(html, url)
+                if pandf.empty and needs_javascript(html):
+                    # Table not in the served HTML; render the page in the browser
+                    if browser is None:
+                        browser = drivers.enter_context(borrow_driver("Chrome", temppath))
+                    pandf = get_list_page(browser, url)
+                    html = browser.page_source
+                archive.put(url, html, "list", orgname, org_name_index, page=n)
+                journal.append(pandf)
+                session.page_done(n)
+                retryq.done(url)
+                elapsed = time.monotonic() - began - waited
+                pacer.record(elapsed, empty=pandf.empty)
+                metrics.fetch(org_name_index, "list", elapsed, page_bytes(html), len(pandf))
+                log(COUNTS, {"pages_done": 1, "rows": len(pandf)})
+                log("info", f"finished: {n}")
             
-            for i in range(total):
-                nols.append(ls1[i * 4].text)
-                namels.append(ls1[i * 4 + 1].text)
-                datels.append(ls1[i * 4 + 2].text)
-                docls.append(ls1[i * 4 + 3].text)
-
-            ls2 = browser.find_elements(By.XPATH, "//tbody//a")
-            linkls = []
-            
-            for link in ls2:
-                linkls.append(link.get_attribute("href"))
-                
-            pandf = pd.DataFrame(
-                {
-                    "no": nols,
-                    "name": namels,
-                    "date": datels,
-                    "link": linkls,
-                    "doc": docls,
-                }
-            )
-            resultls.append(pandf)
-            st.info(f"finished: {n}")
-            
-        except Exception as e:
-            st.error(f"error!: {e}")
-            errorls.append(url)
-
-        mod = (n + 1) % 2
-        if mod == 0 and count > 0:
-            tempdf = pd.concat(resultls)
-            savename = f"tempsum-{org_name_index}{count + 1}"
-            savedf(tempdf, savename)
-
-        wait = random.randint(2, 20)
-        time.sleep(wait)
-        st.info(f"finish: {count}")
-        count += 1
-
-    browser.quit()
+            except CrawlStopped:
+                raise
+            except Exception as e:
+                pacer.record(error=True)
+                metrics.fetch(org_name_index, "list", time.monotonic() - began - waited, error=e)
+                retryq.add(url, "list", orgname, org_name_index, e, page=n)
+                log(COUNTS, {"pages_done": 1, "errors": 1})
+                log("error", f"error!: {e}")
+                errorls.append(url)
+
+            metrics.sleep(org_name_index, "list", waited + pacer.wait())
+            log("info", f"finish: {count}")
+            count += 1
+
+    journal.close()
+    metrics.write()
     
-    if len(resultls) > 0:
-        sumdf = pd.concat(resultls)
+    sumdf = journal.replay()
+    if not sumdf.empty:
         sumdf["区域"] = orgname
         savedf(sumdf, f"tempsumall-{org_name_index}{count}")
     else:
         sumdf = pd.DataFrame()
 
+    session.finish()
     return sumdf
 
 
@@ -119,12 +223,8 @@ def update_sumeventdf(currentsum, orgname):
         DataFrame containing new event summaries
     """
     org_name_index = org2name[orgname]
-    oldsum = get_safesum(orgname)
-    
-    if oldsum.empty:
-        oldidls = []
-    else:
-        oldidls = oldsum["link"].tolist()
+    storage = get_storage()
+    oldidls = set(storage.links("safesum", orgname))
         
     currentidls = currentsum["link"].tolist()
     newidls = [x for x in currentidls if x not in oldidls]
@@ -135,11 +235,231 @@ def update_sumeventdf(currentsum, orgname):
         nowstr = get_now()
         savename = f"safesum{org_name_index}{nowstr}"
         newdf["区域"] = orgname
-        savedf(newdf, savename)
+        storage.save(newdf, "safesum", savename)
         
     return newdf
 
 
+def plan_list_pages(orgname, start=1, log=None):
+    """
+    Find the last list page that may hold new cases.
+
+    Pages list the newest cases first, so the pages holding only unknown
+    links come before the first page holding a known one. That boundary is
+    located by galloping forward from start (start+1, start+2, start+4, ...)
+    and then bisecting, reading each probed page over HTTP and comparing its
+    links with the stored ones. The total page count from the pagination
+    control bounds the search.
+
+    Args:
+        orgname: Name of the organization
+        start: First page to scrape
+        log: Progress callback taking a Streamlit message level and text
+            (writes to the page if None)
+
+    Returns:
+        Last page to scrape (the first page holding a known link, or the last
+        page of the site), or None if the list cannot be read over HTTP
+    """
+    log = log or st_log
+    org_name_index = org2name[orgname]
+    pacer = get_pacer(org_name_index)
+    metrics = get_metrics()
+    known = set(get_storage().links("safesum", orgname))
+    probes = {}
+
+    def fetch(page):
+        url = list_url(org_name_index, page)
+        began = time.monotonic()
+        waited = 0.0
+        try:
+            html, waited = fetch_limited(url)
+            df = parse_list_html(html, url)
+        except Exception as e:
+            pacer.record(error=True)
+            metrics.fetch(org_name_index, "list", time.monotonic() - began - waited, error=e)
+            raise
+        elapsed = time.monotonic() - began - waited
+        pacer.record(elapsed, empty=df.empty)
+        metrics.fetch(org_name_index, "list", elapsed, page_bytes(html), len(df))
+        metrics.sleep(org_name_index, "list", waited + pacer.wait())
+        return html, df
+
+    def all_new(page):
+        # Pages past the end hold no new cases
+        if page not in probes:
+            if total is not None and page > total:
+                probes[page] = False
+            else:
+                df = fetch(page)[1]
+                probes[page] = not df.empty and not df["link"].isin(known).any()
+            log("info", f"page {page}: {'new' if probes[page] else 'known'}")
+        return probes[page]
+
+    html, df = fetch(start)
+    if df.empty:
+        # The table needs JavaScript, or start is past the last page
+        return None
+    total = parse_page_count(html)
+    probes[start] = not df["link"].isin(known).any()
+    log("info", f"共{total or '?'}页")
+
+    if not probes[start]:
+        return start
+
+    # Gallop to a page that is not all new, then bisect (lo all new, hi not)
+    lo, step = start, 1
+    hi = start + step
+    while all_new(hi):
+        lo = hi
+        if total is not None and lo >= total:
+            return total
+        step *= 2
+        hi = start + step
+        if total is not None:
+            hi = min(hi, total + 1)
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if all_new(mid):
+            lo = mid
+        else:
+            hi = mid
+
+    return hi if total is None or hi <= total else total
+
+
+def update_region_list(orgname, start, end, log=None):
+    """
+    Update the case list of one region.
+
+    The last page holding new cases is located with plan_list_pages and all
+    pages up to it are scraped in one session. If the list cannot be read
+    over HTTP, pages are scraped from start to end and, while every scraped
+    case is new, the following page is scraped too.
+
+    Args:
+        orgname: Name of the organization
+        start: Starting page number
+        end: Ending page number
+        log: Progress callback taking a Streamlit message level and text
+            (writes to the page if None)
+
+    Returns:
+        DataFrame containing the new event summaries
+    """
+    log = log or st_log
+
+    try:
+        last = plan_list_pages(orgname, start, log)
+    except Exception as e:
+        log("warning", f"无法确定新案例页数：{e}")
+        last = None
+
+    if last is not None:
+        end = max(end, last)
+        log("info", f"更新第{start}-{end}页")
+        sumeventdf = get_sumeventdf(orgname, start, end, log)
+        log("success", f"获取了{len(sumeventdf)}条案例")
+        if sumeventdf.empty:
+            return pd.DataFrame()
+        newsum = update_sumeventdf(sumeventdf, orgname)
+        log("success", f"共{len(newsum)}条案例待更新")
+        return newsum
+
+    newls = []
+
+    while True:
+        sumeventdf = get_sumeventdf(orgname, start, end, log)
+        length = len(sumeventdf)
+        log("success", f"获取了{length}条案例")
+
+        newsum = update_sumeventdf(sumeventdf, orgname)
+        sumevent_len = len(newsum)
+        log("success", f"共{sumevent_len}条案例待更新")
+        newls.append(newsum)
+
+        # If all records are new, continue to the next page
+        if sumevent_len == length and length > 0:
+            start = end + 1
+            end = end + 1
+        else:
+            break
+
+    return pd.concat(newls, ignore_index=True)
+
+
+def update_lists_parallel(org_name_ls, start, end, on_progress, max_workers=REGION_WORKERS):
+    """
+    Update the case lists of several regions concurrently.
+
+    Each region is crawled by its own worker with its own session, journal
+    and pacer; as all list pages are on one host, their requests share that
+    host's limiter (see fetcher.HOST_LIMITS), which bounds the combined
+    rate however many regions run. Progress messages are passed to on_progress from the calling
+    thread, so it may write to the Streamlit page. If on_progress raises, the
+    running regions stop at their next message (their crawl sessions stay
+    resumable) and the exception is re-raised.
+
+    Args:
+        org_name_ls: List of organization names to update
+        start: Starting page number
+        end: Ending page number
+        on_progress: Callback taking the organization name, a Streamlit
+            message level and the message text
+        max_workers: Maximum number of regions crawled at once
+
+    Returns:
+        Dictionary mapping each organization name to its DataFrame of new
+        event summaries, or to the exception that stopped its update
+    """
+    messages = queue.Queue()
+    stop = threading.Event()
+
+    def run(orgname):
+        def log(level, message):
+            if stop.is_set():
+                raise CrawlStopped(orgname)
+            messages.put((orgname, level, message))
+
+        return update_region_list(orgname, start, end, log)
+
+    def drain():
+        while True:
+            try:
+                on_progress(*messages.get_nowait())
+            except queue.Empty:
+                return
+
+    results = {}
+    if not org_name_ls:
+        return results
+
+    workers = max(min(max_workers, len(org_name_ls)), 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, orgname): orgname for orgname in org_name_ls}
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                drain()
+                for future in done:
+                    orgname = futures[future]
+                    try:
+                        results[orgname] = future.result()
+                    except Exception as e:
+                        results[orgname] = e
+        except BaseException:
+            # on_progress failed or was interrupted: stop the regions still running
+            stop.set()
+            for future in pending:
+                future.cancel()
+            raise
+    drain()
+
+    return results
+
+
 def toupt_safesum(org_name_ls):
     """
     Identify organizations that need updates by comparing summary and detail counts.
@@ -153,10 +473,10 @@ def toupt_safesum(org_name_ls):
     touptls = []
     
     for org_name in org_name_ls:
-        oldsum = get_safesum(org_name)
+        oldsum = get_safesum(org_name, columns=["link"])
         lensum = len(oldsum)
         
-        dtl = get_safedetail(org_name)
+        dtl = get_safedetail(org_name, columns=["违法事实"])
         dtl = dtl.dropna(subset=["违法事实"])
         lendtl = len(dtl)
         
@@ -179,13 +499,13 @@ def update_toupd(orgname):
     org_name_index = org2name[orgname]
     currentsum = get_safesum(orgname)
     
-    oldsum = get_safedetail(orgname)
+    oldsum = get_safedetail(orgname, columns=["link", "违法事实"])
     oldsum = oldsum.dropna(subset=["违法事实"])
     
     if oldsum.empty:
-        oldidls = []
+        oldidls = set()
     else:
-        oldidls = [] if "link" not in oldsum.columns else oldsum["link"].tolist()
+        oldidls = set() if "link" not in oldsum.columns else set(oldsum["link"].tolist())
         
     if currentsum.empty:
         currentidls = []
@@ -226,92 +546,275 @@ def get_safetoupd(orgname):
     return pendf
 
 
-def get_eventdetail(eventsum, orgname):
+def get_eventdetail(eventsum, orgname, log=None):
     """
     Scrape detailed event information for a list of events.
+
+    Detail pages are fetched concurrently over HTTP (see fetcher.HOST_LIMITS
+    for the per-host limits); the browser is only used for pages whose
+    table is not in the served HTML.
     
     Args:
         eventsum: DataFrame containing event summaries
         orgname: Name of the organization
+        log: Progress callback taking a Streamlit message level and text
+            (writes to the page if None)
         
     Returns:
         DataFrame containing detailed event information
     """
+    log = log or st_log
     org_name_index = org2name[orgname]
-    browser = get_safari_driver()
     detaills = eventsum["link"].tolist()
     datels = eventsum["date"].tolist()
+    datemap = dict(zip(detaills, datels))
+
+    # Links finished by an interrupted run are skipped and their journaled
+    # rows merged into this run's result
+    session = CrawlSession("detail", org_name_index)
+    journal = session.journal
+    pacer = get_pacer(org_name_index)
+    archive = get_archive()
+    retryq = get_retry_queue()
+    metrics = get_metrics()
+    if session.resumed:
+        log("info", f"继续未完成的详情更新：已完成{len(session.done_links)}条")
+
+    def record(durl, html, df):
+        archive.put(durl, html, "detail", orgname, org_name_index, date=datemap[durl])
+        df["link"] = durl
+        df["date"] = datemap[durl]
+        df["区域"] = orgname
+        journal.append(df)
+        session.link_done(durl)
+        retryq.done(durl)
 
-    resultls = []
     errorls = []
+    jsls = []
     count = 0
-    
-    for date, durl in zip(datels, detaills):
-        st.info(f"{count} begin")
-        st.info(f"url: {durl}")
-        
-        try:
-            browser.get(durl)
-            hl1 = browser.find_elements(By.XPATH, "//body//th")
-            dl1 = browser.find_elements(By.XPATH, "//body//td")
-            
-            df = web2table(hl1, dl1)
-            df["link"] = durl
-            df["date"] = date
-            resultls.append(df)
-
-        except Exception as e:
-            st.error(f"error!: {e}")
-            st.error(f"check url: {durl}")
+    todo = [x for x in dict.fromkeys(detaills) if x not in session.done_links]
+    log(COUNTS, {"pages_total": len(todo)})
+
+    # Fetch over HTTP concurrently within each host's limits, the requests
+    # spaced by the region's pacer
+    for durl, html, row, error, seconds, waited in fetch_details(todo, pace=pacer.pace):
+        log("info", f"{count} url: {durl}")
+        nbytes = 0 if html is None else page_bytes(html)
+        metrics.fetch(org_name_index, "detail", seconds, nbytes, 1 if row else 0, error)
+        metrics.sleep(org_name_index, "detail", waited)
+        if error is not None:
+            pacer.record(error=True)
+            retryq.add(durl, "detail", orgname, org_name_index, error, date=datemap[durl])
+            log(COUNTS, {"pages_done": 1, "errors": 1})
+            log("error", f"error!: {error}")
+            log("error", f"check url: {durl}")
             errorls.append(durl)
-
-        mod = (count + 1) % 10
-        if mod == 0 and count > 0:
-            if resultls:
-                tempdf = pd.concat(resultls)
-                tempdf["区域"] = orgname
-                savename = f"tempdtl-{org_name_index}{count + 1}"
-                savetempsub(tempdf, savename, org_name_index)
-
-        wait = random.randint(2, 20)
-        time.sleep(wait)
-        st.info(f"finish: {count}")
+        elif not row:
+            # Table not in the served HTML; render the page in the browser
+            jsls.append(durl)
+        else:
+            pacer.record(seconds)
+            record(durl, html, pd.DataFrame(row, index=[0]))
+            log(COUNTS, {"pages_done": 1, "rows": 1})
         count += 1
 
-    browser.quit()
+    if jsls:
+        with borrow_driver(DETAIL_BROWSER, temppath) as browser:
+            for durl in jsls:
+                log("info", f"{count} begin")
+                log("info", f"url: {durl}")
+        
+                began = time.monotonic()
+                try:
+                    browser.get(durl)
+                    table = extract_table(browser)
+                    html = browser.page_source
+            
+                    record(durl, html, web2table(table["headers"], table["cells"]))
+                    elapsed = time.monotonic() - began
+                    pacer.record(elapsed, empty=not table["cells"])
+                    metrics.fetch(org_name_index, "detail", elapsed, page_bytes(html), 1)
+
+                except Exception as e:
+                    pacer.record(error=True)
+                    metrics.fetch(org_name_index, "detail", time.monotonic() - began, error=e)
+                    retryq.add(durl, "detail", orgname, org_name_index, e, date=datemap[durl])
+                    log(COUNTS, {"pages_done": 1, "errors": 1})
+                    log("error", f"error!: {e}")
+                    log("error", f"check url: {durl}")
+                    errorls.append(durl)
+                else:
+                    # Outside the try: a cancelled job must not undo the recorded page
+                    log(COUNTS, {"pages_done": 1, "rows": 1})
+
+                metrics.sleep(org_name_index, "detail", pacer.wait())
+                log("info", f"finish: {count}")
+                count += 1
+
+    journal.close()
+    metrics.write()
     
     if len(errorls) > 0:
-        st.error("error list:")
-        st.error(errorls)
+        log("error", "error list:")
+        log("error", ", ".join(errorls))
         
-    if resultls:
-        safedf = pd.concat(resultls)
+    safedf = journal.replay()
+    if not safedf.empty:
         safedf["区域"] = orgname
         savecsv = f"safedtl{org_name_index}{get_now()}"
         safedf.reset_index(drop=True, inplace=True)
         
         savetempsub(safedf, savecsv, org_name_index)
-        savedf(safedf, savecsv)
+        get_storage().save(safedf, "safedtl", savecsv)
     else:
         safedf = pd.DataFrame()
 
+    session.finish()
     return safedf
 
 
+def retry_failed(log=None, limit=None):
+    """
+    Retry the failed pages whose next attempt is due.
+
+    List pages are merged through update_sumeventdf and detail rows saved as
+    a new detail snapshot per region, as a normal update would; detail pages
+    without a served table are rendered in the detail browser, as in
+    get_eventdetail. Pages that fail again are rescheduled with a longer backoff, or dead-lettered once
+    they run out of attempts.
+
+    Args:
+        log: Progress callback taking a Streamlit message level and text
+            (writes to the page if None)
+        limit: Maximum number of pages to retry (all due pages if None)
+
+    Returns:
+        Dictionary with the number of pages "fixed", "failed" and "dead"
+    """
+    log = log or st_log
+    retryq = get_retry_queue()
+    archive = get_archive()
+    metrics = get_metrics()
+    summary = {"fixed": 0, "failed": 0, "dead": 0}
+    sumls = {}
+    dtlls = {}
+
+    items = retryq.due(limit)
+    log(COUNTS, {"pages_total": len(items)})
+
+    try:
+        # A pooled browser is borrowed for the first detail page that needs one
+        with ExitStack() as drivers:
+            browser = None
+            for item in items:
+                url = item["url"]
+                orgname = item["orgname"]
+                region = item["region"]
+                pacer = get_pacer(region)
+                log("info", f"retry {item['attempts']}: {url}")
+
+                began = time.monotonic()
+                try:
+                    if item["kind"] == "list":
+                        html = fetch_limited(url)[0]
+                        df = parse_list_html(html, url)
+                        if df.empty:
+                            raise ValueError("list page has no rows")
+                        archive.put(url, html, "list", orgname, region, page=item.get("page"))
+                        df["区域"] = orgname
+                        sumls.setdefault(orgname, []).append(df)
+                    else:
+                        html = fetch_detail_html(url)
+                        row = parse_detail_html(html)
+                        if row:
+                            df = pd.DataFrame(row, index=[0])
+                        else:
+                            # Table not in the served HTML; render the page in the browser
+                            if browser is None:
+                                browser = drivers.enter_context(
+                                    borrow_driver(DETAIL_BROWSER, temppath)
+                                )
+                            browser.get(url)
+                            table = extract_table(browser)
+                            if not table["cells"]:
+                                raise ValueError("detail page has no table")
+                            html = browser.page_source
+                            df = web2table(table["headers"], table["cells"])
+                        archive.put(
+                            url, html, "detail", orgname, region, date=item.get("date")
+                        )
+                        df["link"] = url
+                        df["date"] = item.get("date")
+                        df["区域"] = orgname
+                        dtlls.setdefault((orgname, region), []).append(df)
+                    retryq.done(url)
+                    elapsed = time.monotonic() - began
+                    pacer.record(elapsed, empty=False)
+                    metrics.fetch(region, item["kind"], elapsed, page_bytes(html), len(df))
+                    summary["fixed"] += 1
+
+                except Exception as e:
+                    pacer.record(error=True)
+                    metrics.fetch(region, item["kind"], time.monotonic() - began, error=e)
+                    meta = {key: item[key] for key in ("page", "date") if key in item}
+                    state = retryq.add(url, item["kind"], orgname, region, e, **meta)
+                    summary["dead" if state == "dead" else "failed"] += 1
+                    log(COUNTS, {"pages_done": 1, "errors": 1})
+                    log("error", f"error!: {e}")
+                else:
+                    # Outside the try: a cancelled job must not requeue a fixed page
+                    log(COUNTS, {"pages_done": 1, "rows": len(df)})
+
+                metrics.sleep(region, item["kind"], pacer.wait())
+    finally:
+        # Fixed pages are already marked done; save their rows even when the
+        # run stops early, before any progress call can raise again
+        metrics.write()
+        messages = save_retried(sumls, dtlls)
+
+    for message in messages:
+        log("success", message)
+    return summary
+
+
+def save_retried(sumls, dtlls):
+    """
+    Save the rows of retried pages as a normal update would.
+
+    Args:
+        sumls: Mapping of organization name to list page frames
+        dtlls: Mapping of (organization name, region index) to detail frames
+
+    Returns:
+        Progress messages, one per saved region
+    """
+    messages = []
+    for orgname, dflist in sumls.items():
+        newsum = update_sumeventdf(pd.concat(dflist, ignore_index=True), orgname)
+        messages.append(f"{orgname}: 共{len(newsum)}条案例待更新")
+
+    for (orgname, region), dflist in dtlls.items():
+        safedf = pd.concat(dflist, ignore_index=True)
+        savecsv = f"safedtl{region}{get_now()}"
+        savetempsub(safedf, savecsv, region)
+        get_storage().save(safedf, "safedtl", savecsv)
+        messages.append(f"{orgname}: 更新{len(safedf)}条案例详情")
+
+    return messages
+
+
 def web2table(headers, data):
     """
     Convert web table headers and data into a DataFrame.
     
     Args:
-        headers: List of header elements
-        data: List of data elements
+        headers: List of header texts
+        data: List of cell texts
         
     Returns:
         DataFrame containing table data
     """
-    headls = [h.text for h in headers]
-    contls = [d.text for d in data]
-    row_data = dict(zip(headls, contls))
+    row_data = dict(zip(headers, data))
     df = pd.DataFrame(row_data, index=[0])
     return df
 
@@ -0,0 +1,162 @@
+"""
+Resumable Crawl Sessions for DBSafe
+
+A crawl session ties a scraping run for one region to its checkpoint
+journal and to a cursor of the list pages or detail links already
+completed. The session stays on disk until the run's results are saved,
+so a run restarted after a browser crash or a lost Streamlit session
+skips the finished work and merges the journaled rows into its result.
+Once the results are saved the session's journal and cursor are removed.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import glob
+import json
+import os
+from typing import Any, Dict, Optional, Set
+
+from journal import CheckpointJournal
+from utils import get_now
+
+
+# Folder holding per-region crawl state
+temppath = "temp"
+
+# Journal file prefixes by crawl kind
+JOURNAL_PREFIX = {"list": "tempsum", "detail": "tempdtl"}
+
+
+class CrawlSession:
+    """Persisted cursor and checkpoint journal of one region's crawl."""
+
+    def __init__(
+        self,
+        kind: str,
+        region: str,
+        params: Optional[Dict[str, Any]] = None,
+        folder: str = temppath,
+    ):
+        """
+        Resume the unfinished session of a region or start a new one.
+
+        Args:
+            kind: "list" or "detail"
+            region: Region index (see dbsafe.org2name)
+            params: Parameters the crawl must match to be resumed, e.g. the
+                start page of a list crawl (optional)
+            folder: Folder holding the per-region crawl state
+        """
+        if kind not in JOURNAL_PREFIX:
+            raise ValueError(f"Unknown crawl kind: {kind}. Use one of {list(JOURNAL_PREFIX)}.")
+
+        self.kind = kind
+        self.region = region
+        self.params = params or {}
+        self.dirpath = os.path.join(folder, region)
+        self.statepath = os.path.join(self.dirpath, f"session-{kind}.json")
+        os.makedirs(self.dirpath, exist_ok=True)
+
+        state = self._load_state()
+        self.resumed = state is not None and state.get("params", {}) == self.params
+        if not self.resumed:
+            nowstr = get_now()
+            state = {
+                "kind": kind,
+                "region": region,
+                "params": self.params,
+                "started": nowstr,
+                "journal": os.path.join(
+                    self.dirpath, f"{JOURNAL_PREFIX[kind]}-{region}{nowstr}.jsonl"
+                ),
+                "cursor": os.path.join(self.dirpath, f"cursor-{kind}-{region}{nowstr}.txt"),
+            }
+            self._save_state(state)
+
+        self.state = state
+        self.done_pages: Set[int] = set()
+        self.done_links: Set[str] = set()
+        self._read_cursor()
+
+        self.journal = CheckpointJournal(state["journal"])
+        self._cursor = open(state["cursor"], "a", encoding="utf-8")
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        """Load the state of an unfinished session, if any."""
+        if not os.path.exists(self.statepath):
+            return None
+        with open(self.statepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        """Write the session state atomically."""
+        tmppath = self.statepath + ".tmp"
+        with open(tmppath, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmppath, self.statepath)
+
+    def _read_cursor(self) -> None:
+        """Load the completed pages and links recorded by earlier runs."""
+        if not os.path.exists(self.state["cursor"]):
+            return
+        with open(self.state["cursor"], "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, value = line.rstrip("\n").partition("\t")
+                if not sep:
+                    continue
+                if key == "page" and value.isdigit():
+                    self.done_pages.add(int(value))
+                elif key == "link":
+                    self.done_links.add(value)
+
+    def _mark(self, key: str, value: Any) -> None:
+        """Append a completed item to the cursor."""
+        self._cursor.write(f"{key}\t{value}\n")
+        self._cursor.flush()
+
+    def page_done(self, page: int) -> None:
+        """
+        Record a list page as completed; call after its rows are journaled.
+
+        Args:
+            page: Page number
+        """
+        self.done_pages.add(page)
+        self._mark("page", page)
+
+    def link_done(self, link: str) -> None:
+        """
+        Record a detail link as completed; call after its rows are journaled.
+
+        Args:
+            link: Detail page URL
+        """
+        self.done_links.add(link)
+        self._mark("link", link)
+
+    def close(self) -> None:
+        """Close the journal and cursor, leaving the session resumable."""
+        self.journal.close()
+        if not self._cursor.closed:
+            self._cursor.close()
+
+    def finish(self) -> None:
+        """
+        Close the session once its results are saved, so the next run
+        starts fresh.
+
+        The journals and cursors of the region's crawls of this kind are
+        removed, including those left by sessions finished before journals
+        were cleaned up; the saved snapshots hold their rows.
+        """
+        self.close()
+        if os.path.exists(self.statepath):
+            os.remove(self.statepath)
+        patterns = (
+            f"{JOURNAL_PREFIX[self.kind]}-{self.region}*.jsonl",
+            f"cursor-{self.kind}-{self.region}*.txt",
+        )
+        for pattern in patterns:
+            for filepath in glob.glob(os.path.join(self.dirpath, pattern)):
+                os.remove(filepath)
@@ -6,13 +6,25 @@ of visualizations and scraping web content. It configures and manages WebDriver
 instances for Chrome and Safari browsers with appropriate settings for headless
 operation and data extraction.
 
+Drivers are kept in a WebDriverPool and borrowed with ``borrow_driver``, so a
+browser is started once per process instead of once per scraping call. The
+pool health-checks drivers before lending them, clears cookies and cache when
+they are returned, and replaces them after a number of navigations.
+
 Copyright (c) 2023-2024
 License: Apache License 2.0 (see LICENSE file for details)
 """
 
+import atexit
+import glob
 import os
+import re
+import shutil
+import subprocess
+import threading
 import time
-from typing import Any, Optional
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
@@ -34,6 +46,57 @@ SNAPSHOT_SVG_JS = """
    return element.innerHTML;
 """
 
+# JavaScript code returning the header and cell texts and the link targets of
+# a page's tables in a single WebDriver call
+TABLE_JS = """
+    var texts = function (selector) {
+        return Array.from(document.querySelectorAll(selector), function (e) {
+            return e.innerText.trim();
+        });
+    };
+    return {
+        headers: texts(arguments[0]),
+        cells: texts(arguments[1]),
+        links: Array.from(document.querySelectorAll(arguments[2]), function (a) {
+            return a.href;
+        })
+    };
+"""
+
+# chromedriver resolution: an explicit path set with DBSAFE_CHROMEDRIVER, then
+# a cached binary matching the installed Chrome, then the WebDriver Manager
+CHROMEDRIVER_PATH = os.environ.get("DBSAFE_CHROMEDRIVER")
+CHROMEDRIVER_CACHE_DIRS = [os.path.join(os.path.expanduser("~"), ".wdm", "drivers", "chromedriver")]
+CHROME_BINARIES = [
+    "google-chrome",
+    "google-chrome-stable",
+    "chromium",
+    "chromium-browser",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+]
+
+_chromedriver_path: Optional[str] = None
+_chromedriver_lock = threading.Lock()
+
+# Lean detail-page browser: headless Chrome returning at DOMContentLoaded
+# with images, stylesheets and fonts blocked and short timeouts. JavaScript
+# can be switched off with DBSAFE_DETAIL_JS=0 for sites that render
+# server-side.
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+]
+LEAN_PAGE_LOAD_TIMEOUT = 15
+LEAN_SCRIPT_TIMEOUT = 5
+LEAN_JAVASCRIPT = os.environ.get("DBSAFE_DETAIL_JS", "1") != "0"
+
+# Driver pool settings
+DRIVER_POOL_SIZE = 2
+DRIVER_MAX_NAVIGATIONS = 200
+
+_driver_pools: Dict[Tuple[str, str], "WebDriverPool"] = {}
+_driver_pools_lock = threading.Lock()
+
 
 def make_snapshot(
     html_path: str,
@@ -52,7 +115,7 @@ def make_snapshot(
         pixel_ratio: Resolution multiplier for image output (higher values for better quality)
         delay: Time to wait for rendering in seconds
         browser: Browser to use ('Chrome' or 'Safari')
-        driver: Existing WebDriver instance (optional)
+        driver: Existing WebDriver instance (optional, borrowed from the pool if None)
         
     Returns:
         Generated snapshot data (base64 encoded for images, SVG markup for SVG)
@@ -64,12 +127,8 @@ def make_snapshot(
         raise ValueError("Time travel is not possible: delay must be non-negative")
         
     if not driver:
-        if browser == "Chrome":
-            driver = get_chrome_driver("temp")  # Default to temp folder
-        elif browser == "Safari":
-            driver = get_safari_driver()
-        else:
-            raise ValueError(f"Unsupported browser: {browser}. Use 'Chrome' or 'Safari'.")
+        with borrow_driver(browser) as driver:
+            return make_snapshot(html_path, file_type, pixel_ratio, delay, browser, driver)
 
     if file_type == "svg":
         snapshot_js = SNAPSHOT_SVG_JS
@@ -88,6 +147,28 @@ def make_snapshot(
     return driver.execute_script(snapshot_js)
 
 
+def extract_table(
+    driver: Any,
+    header_selector: str = "body th",
+    cell_selector: str = "body td",
+    link_selector: str = "tbody a",
+) -> Dict[str, List[str]]:
+    """
+    Extract the table texts and links of the current page in one round trip.
+
+    Args:
+        driver: WebDriver instance with the page loaded
+        header_selector: CSS selector of the header cells
+        cell_selector: CSS selector of the data cells
+        link_selector: CSS selector of the links
+
+    Returns:
+        Dictionary with "headers" and "cells" (rendered texts, in document
+        order) and "links" (absolute URLs)
+    """
+    return driver.execute_script(TABLE_JS, header_selector, cell_selector, link_selector)
+
+
 def get_chrome_driver(folder: str) -> webdriver.Chrome:
     """
     Initialize and configure a Chrome WebDriver instance.
@@ -144,13 +225,147 @@ def get_chrome_driver(folder: str) -> webdriver.Chrome:
 
     options.add_experimental_option("prefs", prefs)
 
-    # Initialize Chrome driver with WebDriver Manager for automatic driver updates
-    service = ChromeService(executable_path=ChromeDriverManager().install())
+    service = ChromeService(executable_path=resolve_chromedriver())
     driver = webdriver.Chrome(service=service, options=options)
 
     return driver
 
 
+def _get_version(binary: str) -> Optional[str]:
+    """
+    Get the version reported by ``binary --version``.
+
+    Args:
+        binary: Executable name or path
+
+    Returns:
+        Version string such as "120.0.6099.109" or None if unavailable
+    """
+    path = shutil.which(binary) or (binary if os.path.isfile(binary) else None)
+    if path is None:
+        return None
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+(\.\d+)+", result.stdout)
+    return match.group(0) if match else None
+
+
+def get_chrome_version() -> Optional[str]:
+    """
+    Get the version of the installed Chrome.
+
+    Returns:
+        Version string or None if no Chrome binary reports one
+    """
+    for binary in CHROME_BINARIES:
+        version = _get_version(binary)
+        if version:
+            return version
+    return None
+
+
+def find_cached_chromedriver(chrome_version: Optional[str]) -> Optional[str]:
+    """
+    Find a chromedriver binary already on disk for the installed Chrome.
+
+    Args:
+        chrome_version: Installed Chrome version; if None, the newest cached
+            driver is used
+
+    Returns:
+        Path of a chromedriver with the same major version or None
+    """
+    candidates = []
+    for folder in CHROMEDRIVER_CACHE_DIRS:
+        for name in ("chromedriver", "chromedriver.exe"):
+            candidates.extend(glob.glob(os.path.join(folder, "**", name), recursive=True))
+
+    versions = []
+    for path in candidates:
+        version = _get_version(path)
+        if version:
+            versions.append((tuple(int(x) for x in version.split(".")), path))
+
+    major = int(chrome_version.split(".")[0]) if chrome_version else None
+    for version, path in sorted(versions, reverse=True):
+        if major is None or version[0] == major:
+            return path
+    return None
+
+
+def resolve_chromedriver() -> str:
+    """
+    Resolve the chromedriver binary once per process.
+
+    The explicit DBSAFE_CHROMEDRIVER path is used first, then a cached driver
+    matching the installed Chrome; only if neither exists is the WebDriver
+    Manager asked to download one, which needs network access.
+
+    Returns:
+        Path of the chromedriver binary
+    """
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path is None:
+            if CHROMEDRIVER_PATH and os.path.isfile(CHROMEDRIVER_PATH):
+                path = CHROMEDRIVER_PATH
+            else:
+                path = find_cached_chromedriver(get_chrome_version())
+            if path is None:
+                path = ChromeDriverManager().install()
+            _chromedriver_path = path
+        return _chromedriver_path
+
+
+def get_lean_chrome_driver(
+    folder: str, javascript: bool = LEAN_JAVASCRIPT
+) -> webdriver.Chrome:
+    """
+    Initialize a headless Chrome WebDriver tuned for reading detail pages.
+
+    Page loads return once the DOM is ready (page load strategy "eager"),
+    images, stylesheets and fonts are never requested, and page loads and
+    scripts time out quickly.
+
+    Args:
+        folder: Download folder path for saving files
+        javascript: Let pages run JavaScript
+
+    Returns:
+        Configured Chrome WebDriver instance
+    """
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.page_load_strategy = "eager"
+
+    prefs = {
+        "download.default_directory": folder,
+        "download.prompt_for_download": False,
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.javascript": 1 if javascript else 2,
+    }
+    options.add_experimental_option("prefs", prefs)
+
+    service = ChromeService(executable_path=resolve_chromedriver())
+    driver = webdriver.Chrome(service=service, options=options)
+
+    # Block the remaining asset requests, fonts included, at the network layer
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+
+    driver.set_page_load_timeout(LEAN_PAGE_LOAD_TIMEOUT)
+    driver.set_script_timeout(LEAN_SCRIPT_TIMEOUT)
+    return driver
+
+
 def get_safari_driver() -> webdriver.Safari:
     """
     Initialize a Safari WebDriver instance.
@@ -162,3 +377,218 @@ def get_safari_driver() -> webdriver.Safari:
         Safari WebDriver instance
     """
     return webdriver.Safari()
+
+
+class PooledDriver:
+    """WebDriver wrapper counting the navigations of a pooled driver."""
+
+    def __init__(self, driver: webdriver.Remote):
+        self.driver = driver
+        self.navigations = 0
+
+    def get(self, url: str) -> None:
+        """Navigate to a URL, counting the navigation."""
+        self.navigations += 1
+        self.driver.get(url)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.driver, name)
+
+
+class WebDriverPool:
+    """Thread-safe pool of reusable WebDriver instances."""
+
+    def __init__(
+        self,
+        factory: Callable[[], webdriver.Remote],
+        size: int = DRIVER_POOL_SIZE,
+        max_navigations: int = DRIVER_MAX_NAVIGATIONS,
+    ):
+        """
+        Create an empty pool; drivers are started on first use.
+
+        Args:
+            factory: Function starting a new driver
+            size: Maximum number of drivers alive at once
+            max_navigations: Navigations after which a driver is replaced
+        """
+        self.factory = factory
+        self.size = max(size, 1)
+        self.max_navigations = max_navigations
+        self._idle: List[PooledDriver] = []
+        self._alive = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def is_healthy(driver: PooledDriver) -> bool:
+        """Check that the browser behind a driver still responds."""
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def reset(driver: PooledDriver) -> None:
+        """Clear cookies, cache and the current page before the next borrower."""
+        driver.delete_all_cookies()
+        if hasattr(driver.driver, "execute_cdp_cmd"):
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+        driver.driver.get("about:blank")
+
+    def _discard(self, driver: PooledDriver) -> None:
+        """Quit a driver and free its place in the pool."""
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._cond:
+            self._alive -= 1
+            self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledDriver:
+        """
+        Take a healthy driver from the pool, starting one if there is room.
+
+        Args:
+            timeout: Seconds to wait for a free driver (wait forever if None)
+
+        Returns:
+            Pooled driver
+
+        Raises:
+            TimeoutError: If no driver becomes free within the timeout
+        """
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("WebDriver pool is closed")
+                if not self._idle and self._alive >= self.size:
+                    if not self._cond.wait_for(
+                        lambda: self._idle or self._alive < self.size or self._closed,
+                        timeout,
+                    ):
+                        raise TimeoutError("No WebDriver available in the pool")
+                    continue
+                if self._idle:
+                    driver = self._idle.pop()
+                else:
+                    driver = None
+                    self._alive += 1
+
+            if driver is None:
+                try:
+                    return PooledDriver(self.factory())
+                except Exception:
+                    with self._cond:
+                        self._alive -= 1
+                        self._cond.notify()
+                    raise
+
+            if self.is_healthy(driver):
+                return driver
+            self._discard(driver)
+
+    def release(self, driver: PooledDriver) -> None:
+        """
+        Return a driver to the pool, resetting it or replacing it when worn out.
+
+        Args:
+            driver: Driver taken with acquire
+        """
+        if self._closed or driver.navigations >= self.max_navigations:
+            self._discard(driver)
+            return
+        try:
+            self.reset(driver)
+        except Exception:
+            self._discard(driver)
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None) -> Iterator[PooledDriver]:
+        """
+        Borrow a driver for the duration of a with block.
+
+        Args:
+            timeout: Seconds to wait for a free driver (wait forever if None)
+
+        Yields:
+            Pooled driver
+        """
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self) -> None:
+        """Quit the idle drivers; borrowed drivers are quit when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+
+def get_driver_pool(browser: str = "Chrome", folder: str = "temp") -> WebDriverPool:
+    """
+    Get the process-wide driver pool of a browser.
+
+    Args:
+        browser: Browser to use ('Chrome', 'LeanChrome' or 'Safari')
+        folder: Download folder path for Chrome
+
+    Returns:
+        WebDriverPool shared by all callers with the same browser and folder
+    """
+    key = (browser, folder)
+    with _driver_pools_lock:
+        if key not in _driver_pools:
+            if browser == "Chrome":
+                pool = WebDriverPool(lambda: get_chrome_driver(folder))
+            elif browser == "LeanChrome":
+                pool = WebDriverPool(lambda: get_lean_chrome_driver(folder))
+            elif browser == "Safari":
+                # safaridriver allows a single session at a time
+                pool = WebDriverPool(get_safari_driver, size=1)
+            else:
+                raise ValueError(
+                    f"Unsupported browser: {browser}. Use 'Chrome', 'LeanChrome' or 'Safari'."
+                )
+            _driver_pools[key] = pool
+        return _driver_pools[key]
+
+
+@contextmanager
+def borrow_driver(
+    browser: str = "Chrome", folder: str = "temp", timeout: Optional[float] = None
+) -> Iterator[PooledDriver]:
+    """
+    Borrow a driver from the process-wide pool of a browser.
+
+    Args:
+        browser: Browser to use ('Chrome', 'LeanChrome' or 'Safari')
+        folder: Download folder path for Chrome
+        timeout: Seconds to wait for a free driver (wait forever if None)
+
+    Yields:
+        Pooled driver
+    """
+    with get_driver_pool(browser, folder).borrow(timeout) as driver:
+        yield driver
+
+
+@atexit.register
+def close_driver_pools() -> None:
+    """Quit every pooled driver."""
+    with _driver_pools_lock:
+        pools = list(_driver_pools.values())
+        _driver_pools.clear()
+    for pool in pools:
+        pool.close()
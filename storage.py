@@ -0,0 +1,247 @@
+"""
+Case Storage Interface for DBSafe
+
+This module puts the CSV snapshots, the Parquet store and the SQLite case
+database behind one interface, so the scraper's write path and the pages'
+read path do not depend on which backend holds the data.
+
+The backend is chosen with the DBSAFE_STORAGE environment variable
+("csv", "parquet" or "sqlite"). When it is not set, the SQLite database is
+used if it exists, then the Parquet store, then the CSV snapshots.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import casedb
+import store
+from utils import get_csvdf, parse_dates, pensafe, savedf
+
+
+# Backend selection
+STORAGE_BACKEND = os.environ.get("DBSAFE_STORAGE", "")
+
+# Seconds between scans of the CSV snapshots for new rows to ingest into the
+# Parquet store; saves through the storage interface trigger the next read's
+# scan right away
+STORE_SYNC_INTERVAL = 60.0
+
+_store_synced_at: Dict[str, float] = {}
+_store_synced_lock = threading.Lock()
+
+
+def _with_columns(columns: Optional[List[str]], extra: List[str]) -> Optional[List[str]]:
+    """Add the columns needed for filtering to a column projection."""
+    if columns is None:
+        return None
+    return list(dict.fromkeys(list(columns) + extra))
+
+
+def filter_cases(
+    df: pd.DataFrame,
+    region: Optional[str] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Filter a case DataFrame by region and publication date in pandas.
+
+    Args:
+        df: DataFrame of case rows
+        region: Region (区域) to keep (optional)
+        date_range: Inclusive (start, end) publication dates; either end
+            may be None (optional)
+
+    Returns:
+        Filtered DataFrame
+    """
+    if df.empty:
+        return df
+
+    if region:
+        df = df[df["区域"] == region]
+
+    if date_range is not None:
+        start, end = date_range
+        dates, _ = parse_dates(df["date"])
+        keep = dates.notna()
+        if start is not None:
+            keep &= dates >= pd.Timestamp(start)
+        if end is not None:
+            keep &= dates <= pd.Timestamp(end)
+        df = df[keep]
+
+    return df
+
+
+class CaseStorage:
+    """Read and write case datasets (safesum, safedtl, safecat)."""
+
+    name = ""
+
+    def read(
+        self,
+        dataset: str,
+        columns: Optional[List[str]] = None,
+        region: Optional[str] = None,
+        date_range: Optional[Tuple[Any, Any]] = None,
+    ) -> pd.DataFrame:
+        """
+        Read a dataset, optionally projected and filtered.
+
+        Args:
+            dataset: Dataset name
+            columns: Columns to load (all columns if None)
+            region: Region (区域) to filter by (optional)
+            date_range: Inclusive (start, end) publication dates (optional)
+
+        Returns:
+            DataFrame of matching case rows
+        """
+        raise NotImplementedError
+
+    def links(self, dataset: str, region: Optional[str] = None) -> List[str]:
+        """
+        Get the links stored in a dataset, optionally for one region.
+
+        Args:
+            dataset: Dataset name
+            region: Region (区域) to filter by (optional)
+
+        Returns:
+            List of links
+        """
+        df = self.read(dataset, ["link"], region=region)
+        if df.empty:
+            return []
+        return df["link"].dropna().tolist()
+
+    def save(self, df: pd.DataFrame, dataset: str, basename: str) -> None:
+        """
+        Save new case rows.
+
+        Every backend keeps writing the timestamped CSV snapshot as the
+        archive of each scrape; backends with their own store also write
+        the rows there.
+
+        Args:
+            df: DataFrame of case rows
+            dataset: Dataset name
+            basename: Base filename of the CSV snapshot (without .csv extension)
+        """
+        savedf(df, basename)
+
+
+class CsvStorage(CaseStorage):
+    """Timestamped CSV snapshots under the pensafe folder."""
+
+    name = "csv"
+
+    def read(self, dataset, columns=None, region=None, date_range=None):
+        df = get_csvdf(pensafe, dataset)
+        df = filter_cases(df, region, date_range)
+        if columns is not None and not df.empty:
+            df = df.reindex(columns=_with_columns(columns, ["区域", "date"]))
+        return df
+
+
+class ParquetStorage(CaseStorage):
+    """
+    Consolidated Parquet store (see store.py), fed from the CSV snapshots
+    by incremental ingestion on read, at most every STORE_SYNC_INTERVAL
+    seconds per dataset.
+    """
+
+    name = "parquet"
+
+    def read(self, dataset, columns=None, region=None, date_range=None):
+        # Datasets that have not been migrated yet are still read from CSV
+        if not store.is_migrated(dataset):
+            return CsvStorage().read(dataset, columns, region, date_range)
+        self.sync(dataset)
+        columns = _with_columns(columns, ["区域", "date"])
+        df = store.read_dataset(dataset, columns, region=region, date_range=date_range)
+        return filter_cases(df, region, date_range)
+
+    def save(self, df, dataset, basename):
+        super().save(df, dataset, basename)
+        with _store_synced_lock:
+            _store_synced_at.pop(dataset, None)
+
+    @staticmethod
+    def sync(dataset: str) -> None:
+        """
+        Ingest new CSV snapshots unless the dataset was synced recently.
+
+        Args:
+            dataset: Dataset name
+        """
+        now = time.monotonic()
+        with _store_synced_lock:
+            synced_at = _store_synced_at.get(dataset)
+            if synced_at is not None and now - synced_at < STORE_SYNC_INTERVAL:
+                return
+            _store_synced_at[dataset] = now
+        try:
+            store.sync_dataset(dataset)
+        except Exception:
+            with _store_synced_lock:
+                _store_synced_at.pop(dataset, None)
+            raise
+
+
+class SqliteStorage(CaseStorage):
+    """SQLite case database keyed by link (see casedb.py)."""
+
+    name = "sqlite"
+
+    def read(self, dataset, columns=None, region=None, date_range=None):
+        casedb.sync_table(dataset)
+        columns = _with_columns(columns, ["区域", "date"])
+        return casedb.read_cases(dataset, columns, region, date_range)
+
+    def links(self, dataset, region=None):
+        casedb.sync_table(dataset)
+        return casedb.read_links(dataset, region)
+
+    def save(self, df, dataset, basename):
+        savepath = savedf(df, basename)
+        casedb.upsert_cases(df, dataset, files=[savepath])
+
+
+BACKENDS = {
+    CsvStorage.name: CsvStorage,
+    ParquetStorage.name: ParquetStorage,
+    SqliteStorage.name: SqliteStorage,
+}
+
+
+def get_storage(backend: str = STORAGE_BACKEND) -> CaseStorage:
+    """
+    Get the case storage backend.
+
+    Args:
+        backend: Backend name ("csv", "parquet" or "sqlite"); detected from
+            the data on disk if empty
+
+    Returns:
+        CaseStorage instance
+    """
+    if not backend:
+        if os.path.exists(casedb.dbpath):
+            backend = SqliteStorage.name
+        elif any(store.is_migrated(name) for name in store.DATASETS):
+            backend = ParquetStorage.name
+        else:
+            backend = CsvStorage.name
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported storage: {backend}. Use one of {list(BACKENDS)}.")
+
+    return BACKENDS[backend]()
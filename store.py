@@ -0,0 +1,428 @@
+"""
+Columnar Case Store for DBSafe
+
+This module keeps a consolidated Parquet copy of the list (safesum), detail
+(safedtl) and category (safecat) case data, so pages can load a single
+dataset with column projection instead of re-parsing every timestamped CSV
+snapshot under the pensafe folder. Datasets are partitioned by region and
+publication year, and readers only open the partitions a region or date
+filter can match.
+
+The store records which CSV files it has absorbed in a persisted manifest.
+Each read first ingests only the snapshots that appeared since the last
+sync, so reload cost scales with the size of the new scrape rather than
+with the size of the archive.
+
+Run ``python store.py migrate`` to (re)build the store from the CSV tree.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils import (
+    diff_manifest,
+    find_csv_files,
+    get_manifest,
+    get_now,
+    parse_dates,
+    pensafe,
+    read_csv_files,
+)
+
+
+# Store location and the datasets it holds
+storepath = os.path.join(pensafe, "store")
+DATASETS = ("safesum", "safedtl", "safecat")
+MANIFEST_NAME = "_manifest.json"
+
+# Part files are laid out as <dataset>/region=<区域>/year=<publication year>/
+PARTITION_COLUMNS = ("region", "year")
+NONE_PARTITION = "__none__"
+
+# Serialises ingestion within the process so concurrent reruns do not
+# append the same snapshot twice
+_sync_lock = threading.Lock()
+
+
+def dataset_path(name: str, folder: str = storepath) -> str:
+    """
+    Get the directory holding the part files of a dataset.
+
+    Args:
+        name: Dataset name (one of DATASETS)
+        folder: Root folder of the store
+
+    Returns:
+        Path of the dataset directory
+    """
+    if name not in DATASETS:
+        raise ValueError(f"Unknown dataset: {name}. Use one of {DATASETS}.")
+    return os.path.join(folder, name)
+
+
+def dataset_files(name: str, folder: str = storepath) -> List[str]:
+    """
+    List the Parquet part files of a dataset in write order.
+
+    Args:
+        name: Dataset name
+        folder: Root folder of the store
+
+    Returns:
+        Sorted list of part file paths
+    """
+    pattern = os.path.join(dataset_path(name, folder), "**", "*.parquet")
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def has_dataset(name: str, folder: str = storepath) -> bool:
+    """
+    Check whether a dataset has been written to the store.
+
+    Args:
+        name: Dataset name
+        folder: Root folder of the store
+
+    Returns:
+        True if at least one part file exists
+    """
+    return len(dataset_files(name, folder)) > 0
+
+
+def _to_text(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert every column to text so part files written from different
+    snapshots share one schema; missing values are kept as nulls.
+    """
+    df = df.reset_index(drop=True)
+    return pd.DataFrame(
+        {col: df[col].astype(str).where(df[col].notna(), None) for col in df.columns}
+    )
+
+
+def _partition_key(value: Any) -> str:
+    """Make a partition directory value, using NONE_PARTITION for missing values."""
+    if value is None or pd.isna(value) or str(value) == "":
+        return NONE_PARTITION
+    return str(value).replace(os.sep, "_")
+
+
+def _partition_years(df: pd.DataFrame) -> pd.Series:
+    """Get the publication year of every row as a partition value."""
+    if "date" not in df.columns:
+        return pd.Series(NONE_PARTITION, index=df.index)
+    dates, _ = parse_dates(df["date"])
+    years = dates.dt.year.astype("Int64").astype(str)
+    return years.where(dates.notna(), NONE_PARTITION)
+
+
+def partition_of(filepath: str, folder: str) -> Dict[str, str]:
+    """
+    Get the partition values encoded in a part file's path.
+
+    Args:
+        filepath: Path of a part file
+        folder: Dataset directory the path is relative to
+
+    Returns:
+        Mapping of partition column ("region", "year") to value; parts written
+        before partitioning was introduced have no entries
+    """
+    parts = os.path.relpath(os.path.dirname(filepath), folder).split(os.sep)
+    values = {}
+    for part in parts:
+        key, sep, value = part.partition("=")
+        if sep and key in PARTITION_COLUMNS:
+            values[key] = value
+    return values
+
+
+def append_dataset(df: pd.DataFrame, name: str, folder: str = storepath) -> List[str]:
+    """
+    Append a DataFrame to a dataset, writing one new part file per
+    region/publication-year partition.
+
+    Each part is written to a temporary name first and then renamed, so
+    readers never see a partially written file.
+
+    Args:
+        df: DataFrame to append
+        name: Dataset name
+        folder: Root folder of the store
+
+    Returns:
+        Paths of the written part files
+    """
+    if df.empty:
+        return []
+
+    textdf = _to_text(df)
+    if "区域" in textdf.columns:
+        regions = textdf["区域"].apply(_partition_key)
+    else:
+        regions = pd.Series(NONE_PARTITION, index=textdf.index)
+    years = _partition_years(textdf)
+
+    partpaths = []
+    partid = f"{get_now()}-{uuid.uuid4().hex[:8]}"
+    for (region, year), partdf in textdf.groupby([regions, years], sort=True):
+        dirpath = os.path.join(dataset_path(name, folder), f"region={region}", f"year={year}")
+        os.makedirs(dirpath, exist_ok=True)
+
+        partpath = os.path.join(dirpath, f"part-{partid}.parquet")
+        tmppath = partpath + ".tmp"
+        partdf.to_parquet(tmppath, index=False)
+        os.replace(tmppath, partpath)
+        partpaths.append(partpath)
+
+    return partpaths
+
+
+def prune_files(
+    name: str,
+    region: Optional[str] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+    folder: str = storepath,
+) -> List[str]:
+    """
+    Select the part files that can hold rows for a region and date range.
+
+    Args:
+        name: Dataset name
+        region: Region (区域) to read (optional)
+        date_range: Inclusive (start, end) publication dates; either end may
+            be None (optional)
+        folder: Root folder of the store
+
+    Returns:
+        Paths of the part files to open
+    """
+    dirpath = dataset_path(name, folder)
+    if date_range is not None:
+        start, end = date_range
+        minyear = pd.Timestamp(start).year if start is not None else None
+        maxyear = pd.Timestamp(end).year if end is not None else None
+
+    selected = []
+    for filepath in dataset_files(name, folder):
+        values = partition_of(filepath, dirpath)
+
+        if region and "region" in values and values["region"] != _partition_key(region):
+            continue
+
+        if date_range is not None and "year" in values:
+            if values["year"] == NONE_PARTITION:
+                continue
+            year = int(values["year"])
+            if minyear is not None and year < minyear:
+                continue
+            if maxyear is not None and year > maxyear:
+                continue
+
+        selected.append(filepath)
+
+    return selected
+
+
+def read_dataset(
+    name: str,
+    columns: Optional[List[str]] = None,
+    folder: str = storepath,
+    region: Optional[str] = None,
+    date_range: Optional[Tuple[Any, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Read a dataset from the store, loading only the requested columns and
+    only the partitions that can match the region and date range.
+
+    Partitions are pruned by whole region and year; callers still filter
+    rows by exact date. Columns that a part file does not contain are filled
+    with NaN, matching the behaviour of concatenating CSV snapshots with
+    different headers.
+
+    Args:
+        name: Dataset name
+        columns: Columns to load (all columns if None)
+        folder: Root folder of the store
+        region: Region (区域) to read (optional)
+        date_range: Inclusive (start, end) publication dates (optional)
+
+    Returns:
+        Concatenated DataFrame of the selected part files or empty DataFrame if none found
+    """
+    import pyarrow.parquet as pq
+
+    dflist = []
+    for filepath in prune_files(name, region, date_range, folder):
+        if columns is None:
+            partdf = pd.read_parquet(filepath)
+        else:
+            names = pq.read_schema(filepath).names
+            partdf = pd.read_parquet(filepath, columns=[c for c in columns if c in names])
+        dflist.append(partdf)
+
+    if len(dflist) > 0:
+        df = pd.concat(dflist)
+        df.reset_index(drop=True, inplace=True)
+    else:
+        df = pd.DataFrame()
+
+    if columns is not None:
+        df = df.reindex(columns=columns)
+
+    return df
+
+
+def load_manifest(folder: str = storepath) -> Dict[str, List[List]]:
+    """
+    Load the manifest of CSV files absorbed into the store.
+
+    Args:
+        folder: Root folder of the store
+
+    Returns:
+        Mapping of dataset name to [path, mtime, size] entries
+    """
+    manifestpath = os.path.join(folder, MANIFEST_NAME)
+    if not os.path.exists(manifestpath):
+        return {}
+    with open(manifestpath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: Dict[str, List[List]], folder: str) -> None:
+    """Write the manifest atomically."""
+    os.makedirs(folder, exist_ok=True)
+    manifestpath = os.path.join(folder, MANIFEST_NAME)
+    tmppath = manifestpath + ".tmp"
+    with open(tmppath, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmppath, manifestpath)
+
+
+def is_migrated(name: str, folder: str = storepath) -> bool:
+    """
+    Check whether a dataset is maintained by the store.
+
+    Stores built before the manifest existed have part files but no
+    manifest entry; they count as migrated and are rebuilt on the next sync.
+
+    Args:
+        name: Dataset name
+        folder: Root folder of the store
+
+    Returns:
+        True if the dataset has been migrated
+    """
+    return name in load_manifest(folder) or has_dataset(name, folder)
+
+
+def sync_dataset(
+    name: str, penfolder: str = pensafe, folder: str = storepath, rebuild: bool = False
+) -> int:
+    """
+    Ingest the CSV snapshots of a dataset that the store has not seen yet.
+
+    New files are parsed and appended as one part file. If a file that was
+    already absorbed has changed or been removed, or the dataset was written
+    without a manifest entry, the dataset is rebuilt from all current files
+    instead.
+
+    Args:
+        name: Dataset name
+        penfolder: Folder containing the CSV snapshots
+        folder: Root folder of the store
+        rebuild: Rebuild the dataset from all files regardless of the manifest
+
+    Returns:
+        Number of rows ingested
+    """
+    dataset_path(name, folder)
+
+    with _sync_lock:
+        manifest = load_manifest(folder)
+        current = get_manifest(find_csv_files(penfolder, name))
+        previous = tuple(tuple(entry) for entry in manifest.get(name, []))
+
+        if current == previous and not rebuild and name in manifest:
+            return 0
+
+        added, stale = diff_manifest(previous, current)
+        # Part files without a manifest entry cannot be told apart by source
+        # file, so they are replaced rather than appended to
+        legacy = name not in manifest and has_dataset(name, folder)
+        if rebuild or stale or legacy:
+            oldfiles = dataset_files(name, folder)
+            df = read_csv_files([entry[0] for entry in current])
+            append_dataset(df, name, folder)
+            for filepath in oldfiles:
+                os.remove(filepath)
+        else:
+            df = read_csv_files(added)
+            append_dataset(df, name, folder)
+
+        manifest[name] = [list(entry) for entry in current]
+        _save_manifest(manifest, folder)
+
+    return len(df)
+
+
+def migrate_csv_tree(penfolder: str = pensafe, folder: str = storepath) -> Dict[str, int]:
+    """
+    Rebuild every dataset of the store from the CSV snapshots in penfolder.
+
+    Existing part files are removed only after the new ones are written.
+
+    Args:
+        penfolder: Folder containing the CSV snapshots
+        folder: Root folder of the store
+
+    Returns:
+        Mapping of dataset name to the number of rows migrated
+    """
+    counts = {}
+    for name in DATASETS:
+        counts[name] = sync_dataset(name, penfolder, folder, rebuild=True)
+    return counts
+
+
+def main() -> None:
+    """Command line entry point for store maintenance."""
+    parser = argparse.ArgumentParser(description="DBSafe case store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="rebuild the store from CSV files")
+    migrate.add_argument("--penfolder", default=pensafe, help="CSV snapshot folder")
+    migrate.add_argument("--store", default=storepath, help="store folder")
+
+    sync = subparsers.add_parser("sync", help="ingest CSV files not seen before")
+    sync.add_argument("--penfolder", default=pensafe, help="CSV snapshot folder")
+    sync.add_argument("--store", default=storepath, help="store folder")
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        counts = migrate_csv_tree(args.penfolder, args.store)
+    else:
+        counts = {
+            name: sync_dataset(name, args.penfolder, args.store)
+            for name in DATASETS
+            if is_migrated(name, args.store)
+        }
+
+    for name, count in counts.items():
+        print(f"{name}: {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import pytest
+import requests
+
+import fetcher
+from conftest import read_fixture
+
+
+def test_parse_list_html():
+    url = "http://www.safe.gov.cn/www/illegal/index?page=1&siteid=beijing"
+    df = fetcher.parse_list_html(read_fixture("list_page.html"), url)
+
+    assert list(df.columns) == ["no", "name", "date", "link", "doc"]
+    assert df["no"].tolist() == ["1", "2"]
+    assert df["name"].tolist() == ["某贸易有限公司逃汇案", "某科技有限公司违规结汇案"]
+    assert df["date"].tolist() == ["2024-01-05", "2023-12-20"]
+    assert df["link"].tolist() == [
+        "http://www.safe.gov.cn/beijing/2024/0105/1234.html",
+        "http://www.safe.gov.cn/beijing/2023/1220/1201.html",
+    ]
+    assert df["doc"].tolist() == ["京汇罚〔2024〕1号", "京汇罚〔2023〕58号"]
+
+
+def test_parse_page_count():
+    assert fetcher.parse_page_count(read_fixture("list_page.html")) == 3
+    assert fetcher.parse_page_count(read_fixture("list_script.html")) is None
+
+
+def test_empty_list_page_has_no_rows():
+    html = read_fixture("list_empty.html")
+    assert fetcher.parse_list_html(html, "http://www.safe.gov.cn/").empty
+    assert not fetcher.needs_javascript(html)
+
+
+def test_scripted_list_page_needs_javascript():
+    html = read_fixture("list_script.html")
+    assert fetcher.parse_list_html(html, "http://www.safe.gov.cn/").empty
+    assert fetcher.needs_javascript(html)
+
+
+def test_parse_detail_html():
+    row = fetcher.parse_detail_html(read_fixture("detail_page.html"))
+
+    assert row["违规主体名称"] == "某贸易有限公司"
+    assert row["注册地址"] == "北京市朝阳区"
+    assert row["违法事实"] == "2022年至2023年，该公司以虚构贸易背景方式\n将外汇资金违规汇出境外。"
+    assert row["罚款金额（万元）"] == "120"
+
+
+def test_parse_detail_html_without_table():
+    html = read_fixture("detail_notable.html")
+    assert fetcher.parse_detail_html(html) == {}
+    assert fetcher.needs_javascript(html)
+
+
+def test_fetch_html(fixture_server, response_cache):
+    url = fixture_server + "list_page.html"
+
+    assert fetcher.fetch_html(url) == read_fixture("list_page.html")
+    assert response_cache.counts["misses"] == 1
+
+    # List pages are revalidated every time; the server answers 304
+    html, _ = fetcher.fetch_limited(url)
+    assert len(fetcher.parse_list_html(html, url)) == 2
+    assert response_cache.counts["revalidated"] == 1
+
+
+def test_fetch_detail_html_uses_cache(fixture_server, response_cache):
+    url = fixture_server + "detail_page.html"
+
+    html = fetcher.fetch_detail_html(url)
+    assert fetcher.parse_detail_html(html)["违规主体名称"] == "某贸易有限公司"
+    assert fetcher.fetch_detail_html(url) == read_fixture("detail_page.html")
+    assert response_cache.counts == {"hits": 1, "revalidated": 0, "misses": 1}
+
+
+def test_fetch_html_missing_page(fixture_server, response_cache):
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_html(fixture_server + "missing.html")
+
+
+def test_fetch_details(fixture_server, response_cache, monkeypatch):
+    monkeypatch.setattr(fetcher, "_host_limiters", {})
+    monkeypatch.setitem(
+        fetcher.HOST_LIMITS, fixture_server.split("/")[2], {"rate": 100.0, "jitter": (0, 0)}
+    )
+    urls = [fixture_server + name for name in ("detail_page.html", "detail_notable.html")]
+
+    paced = []
+
+    def pace():
+        paced.append(1)
+        return 0.0
+
+    results = {
+        url: (row, error) for url, _, row, error, _, _ in fetcher.fetch_details(urls, pace=pace)
+    }
+
+    assert results[urls[0]][0]["罚款金额（万元）"] == "120"
+    assert results[urls[1]] == ({}, None)
+    assert len(paced) == 2
+
+    # Cached pages are not paced
+    list(fetcher.fetch_details(urls[:1], pace=pace))
+    assert len(paced) == 2
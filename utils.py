@@ -1,28 +1,238 @@
 import os
+import re
 import glob
 import datetime
+import threading
+import numpy as np
 import pandas as pd
 
-from typing import Optional, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, List, Tuple, Union
 
 
-def get_csvdf(penfolder: str, beginwith: str) -> pd.DataFrame:
+# CSV reader settings; the worker count can be set with DBSAFE_CSV_WORKERS
+CSV_ENGINE = "pyarrow"
+CSV_READ_WORKERS: Optional[int] = (
+    int(os.environ["DBSAFE_CSV_WORKERS"]) if os.environ.get("DBSAFE_CSV_WORKERS") else None
+)
+
+
+# Process-wide cache of get_csvdf results, shared by all Streamlit sessions.
+# Each entry maps (penfolder, beginwith) to the file manifest it was read
+# from and the concatenated DataFrame.
+_csv_cache: Dict[Tuple[str, str], Tuple[Tuple, pd.DataFrame]] = {}
+_csv_cache_lock = threading.Lock()
+_csv_cache_stats = {"hits": 0, "misses": 0}
+
+# 14-digit timestamp that ends the snapshot file names written by savedf
+SNAPSHOT_TS_PATTERN = re.compile(r"(\d{14})\.csv$")
+
+# Date values that matched no format, kept per dataset for the summary page
+UNPARSED_DATES_LIMIT = 50
+_unparsed_dates: Dict[str, Dict[str, int]] = {}
+_unparsed_dates_lock = threading.Lock()
+
+
+def get_manifest(files: List[str]) -> Tuple[Tuple[str, int, int], ...]:
     """
-    Read and concatenate multiple CSV files with filenames starting with specific prefix.
+    Build a manifest of (path, mtime, size) entries for a list of files.
+    
+    Files that disappear while the manifest is built are left out.
+    
+    Args:
+        files: List of file paths
+        
+    Returns:
+        Sorted tuple of (path, mtime in nanoseconds, size in bytes)
+    """
+    entries = []
+    for filepath in files:
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            continue
+        entries.append((filepath, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(entries))
+
+
+def invalidate_csv_cache(filepath: Optional[str] = None) -> None:
+    """
+    Drop cached get_csvdf results after a CSV file is written.
+    
+    New files are picked up incrementally through the manifest, so only
+    entries that were read from an overwritten file need to be dropped.
+    
+    Args:
+        filepath: Path of the written file (drops every entry if None)
+    """
+    with _csv_cache_lock:
+        if filepath is None:
+            _csv_cache.clear()
+            return
+        target = os.path.abspath(filepath)
+        for key, (manifest, _) in list(_csv_cache.items()):
+            if any(os.path.abspath(entry[0]) == target for entry in manifest):
+                del _csv_cache[key]
+
+
+def get_csvdf_cache_stats() -> Dict[str, int]:
+    """
+    Get the hit and miss counters of the get_csvdf cache.
+    
+    Returns:
+        Dictionary with "hits", "misses" and "entries" counts
+    """
+    with _csv_cache_lock:
+        stats = dict(_csv_cache_stats)
+        stats["entries"] = len(_csv_cache)
+    return stats
+
+
+def find_csv_files(penfolder: str, beginwith: str) -> List[str]:
+    """
+    Find CSV files under a folder whose names start with a prefix.
     
     Args:
         penfolder: Directory path to search in
         beginwith: String prefix for CSV filenames to match
+        
+    Returns:
+        Sorted list of matching file paths
+    """
+    return sorted(glob.glob(penfolder + "**/" + beginwith + "*.csv", recursive=True))
+
+
+def diff_manifest(
+    old: Tuple[Tuple[str, int, int], ...], new: Tuple[Tuple[str, int, int], ...]
+) -> Tuple[List[str], bool]:
+    """
+    Compare two file manifests.
     
+    Args:
+        old: Manifest the existing data was read from
+        new: Current manifest
+        
     Returns:
-        Concatenated DataFrame of all matching CSV files or empty DataFrame if none found
+        Tuple of (paths only present in new, whether any old entry was
+        changed or removed)
+    """
+    newentries = set(new)
+    stale = any(entry not in newentries for entry in old)
+    oldpaths = {entry[0] for entry in old}
+    added = [entry[0] for entry in new if entry[0] not in oldpaths]
+    return added, stale
+
+
+def _snapshot_key(filepath: str) -> Tuple[str, str]:
+    """
+    Split a snapshot path into its series and timestamp.
+    
+    Args:
+        filepath: Path of a CSV file written by savedf
+        
+    Returns:
+        Tuple of (folder and name without the timestamp, timestamp), with an
+        empty timestamp for names that do not end in one
+    """
+    match = SNAPSHOT_TS_PATTERN.search(filepath)
+    if match is None:
+        return filepath, ""
+    return filepath[: match.start()], match.group(1)
+
+
+def out_of_order(cached: List[str], added: List[str]) -> bool:
+    """
+    Check whether a new snapshot is older than a cached one of its series.
+    
+    Rows of one region only compete with rows of the same region, so new
+    snapshots of other regions can be appended in any order.
+    
+    Args:
+        cached: Paths the existing data was read from
+        added: Paths of the new files
+        
+    Returns:
+        True if any added file has a timestamp before the latest cached
+        file with the same folder, prefix and region
+    """
+    latest: Dict[str, str] = {}
+    for filepath in cached:
+        series, ts = _snapshot_key(filepath)
+        if ts > latest.get(series, ""):
+            latest[series] = ts
+    for filepath in added:
+        series, ts = _snapshot_key(filepath)
+        if ts and ts < latest.get(series, ""):
+            return True
+    return False
+
+
+def _read_csv_file(filepath: str, engine: str = CSV_ENGINE) -> pd.DataFrame:
+    """
+    Read one CSV file written by savedf, dropping its index column.
+    
+    The pyarrow engine parses with multiple threads. Columns it infers as
+    dates or timestamps are turned back into text, and all-empty columns
+    into floats, so the result matches the pandas parser; files pyarrow
+    cannot parse fall back to pandas.
+    
+    Args:
+        filepath: Path of the CSV file
+        engine: "pyarrow" or any pandas read_csv engine
+        
+    Returns:
+        DataFrame of the file contents
+    """
+    if engine == "pyarrow":
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pacsv
+        except ImportError:
+            engine = "c"
+    
+    if engine == "pyarrow":
+        try:
+            table = pacsv.read_csv(
+                filepath,
+                read_options=pacsv.ReadOptions(use_threads=True),
+                convert_options=pacsv.ConvertOptions(strings_can_be_null=True),
+            )
+        except pa.ArrowInvalid:
+            return pd.read_csv(filepath, index_col=0)
+        
+        for i, field in enumerate(table.schema):
+            if pa.types.is_temporal(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+            elif pa.types.is_null(field.type):
+                table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+        
+        return table.to_pandas().iloc[:, 1:]
+    
+    return pd.read_csv(filepath, index_col=0, engine=engine)
+
+
+def read_csv_files(
+    files: List[str], max_workers: Optional[int] = CSV_READ_WORKERS, engine: str = CSV_ENGINE
+) -> pd.DataFrame:
     """
-    files2 = glob.glob(penfolder + "**/" + beginwith + "*.csv", recursive=True)
-    dflist = []
+    Read and concatenate CSV files written by savedf.
     
-    for filepath in files2:
-        pendf = pd.read_csv(filepath, index_col=0)
-        dflist.append(pendf)
+    Files are parsed in parallel on a thread pool; the result keeps the
+    order of files regardless of which file finishes first.
+    
+    Args:
+        files: List of file paths
+        max_workers: Number of reader threads (executor default if None)
+        engine: "pyarrow" (multi-threaded, default) or a pandas read_csv engine
+        
+    Returns:
+        Concatenated DataFrame or empty DataFrame if files is empty
+    """
+    if len(files) <= 1 or max_workers == 1:
+        dflist = [_read_csv_file(filepath, engine) for filepath in files]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dflist = list(executor.map(lambda f: _read_csv_file(f, engine), files))
         
     if len(dflist) > 0:
         df = pd.concat(dflist)
@@ -33,37 +243,192 @@ def get_csvdf(penfolder: str, beginwith: str) -> pd.DataFrame:
     return df
 
 
+def get_csvdf(penfolder: str, beginwith: str) -> pd.DataFrame:
+    """
+    Read and concatenate multiple CSV files with filenames starting with specific prefix.
+    
+    Results are cached per process against the (path, mtime, size) manifest
+    of the matching files. Within each region the rows keep the snapshot
+    timestamp order, which the "latest snapshot wins" de-duplication relies
+    on: when files are only added, just the new files are parsed and
+    appended to the cached frame; a changed or removed file, or a new
+    snapshot older than a cached one of the same region, triggers a full
+    reload.
+    
+    Args:
+        penfolder: Directory path to search in
+        beginwith: String prefix for CSV filenames to match
+    
+    Returns:
+        Concatenated DataFrame of all matching CSV files or empty DataFrame if none found
+    """
+    manifest = get_manifest(find_csv_files(penfolder, beginwith))
+    key = (penfolder, beginwith)
+    
+    with _csv_cache_lock:
+        cached = _csv_cache.get(key)
+        if cached is not None and cached[0] == manifest:
+            _csv_cache_stats["hits"] += 1
+            return cached[1].copy()
+        _csv_cache_stats["misses"] += 1
+    
+    if cached is None:
+        added, stale = [], True
+    else:
+        added, stale = diff_manifest(cached[0], manifest)
+        if out_of_order([entry[0] for entry in cached[0]], added):
+            stale = True
+    
+    if stale:
+        df = read_csv_files([entry[0] for entry in manifest])
+    else:
+        newdf = read_csv_files(added)
+        if cached[1].empty:
+            df = newdf
+        elif newdf.empty:
+            df = cached[1]
+        else:
+            df = pd.concat([cached[1], newdf])
+            df.reset_index(drop=True, inplace=True)
+    
+    with _csv_cache_lock:
+        _csv_cache[key] = (manifest, df)
+        
+    return df.copy()
+
+
+# Date formats used by the regional sites, tried in order
+DATE_FORMATS = [
+    "%Y/%m/%d",
+    "%Y-%m-%d",
+    "%Y年%m月%d日",
+    "%Y.%m.%d",
+    "%Y%m%d",
+    "%Y-%m-%d %H:%M:%S",
+]
+
+
+def parse_dates(
+    values: pd.Series, formats: List[str] = DATE_FORMATS
+) -> Tuple[pd.Series, pd.Series]:
+    """
+    Parse a column of date strings in whole-column passes, one per format.
+    
+    Each pass only looks at the rows earlier formats could not parse.
+    
+    Args:
+        values: Series of date strings
+        formats: strptime formats to try, in order
+        
+    Returns:
+        Tuple of (datetime64 Series aligned with values, Series of the
+        non-empty input values that matched no format)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, values.iloc[:0]
+    
+    text = values.astype("string").str.strip()
+    result = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    pending = (text.notna() & (text != "")).fillna(False).to_numpy(dtype=bool)
+    
+    for fmt in formats:
+        if not pending.any():
+            break
+        positions = np.flatnonzero(pending)
+        parsed = pd.to_datetime(text.iloc[positions], format=fmt, errors="coerce")
+        ok = parsed.notna().to_numpy()
+        result.iloc[positions[ok]] = parsed.to_numpy()[ok]
+        pending[positions[ok]] = False
+    
+    unparsed = values.iloc[np.flatnonzero(pending)]
+    return result, unparsed
+
+
+def note_unparsed_dates(dataset: str, unparsed: pd.Series) -> None:
+    """
+    Record date values that parse_dates could not parse.
+    
+    Up to UNPARSED_DATES_LIMIT distinct values are kept per dataset, with
+    the number of rows holding each; the latest load of a dataset replaces
+    what an earlier load recorded.
+    
+    Args:
+        dataset: Dataset the values were loaded from, e.g. "safedtl"
+        unparsed: Unparsed values returned by parse_dates
+    """
+    counts = unparsed.astype(str).value_counts()
+    with _unparsed_dates_lock:
+        if counts.empty:
+            _unparsed_dates.pop(dataset, None)
+        else:
+            _unparsed_dates[dataset] = {
+                str(value): int(count)
+                for value, count in counts.head(UNPARSED_DATES_LIMIT).items()
+            }
+
+
+def get_unparsed_dates() -> Dict[str, Dict[str, int]]:
+    """
+    Get the date values the latest loads could not parse.
+    
+    Returns:
+        Mapping of dataset name to {raw value: number of rows}
+    """
+    with _unparsed_dates_lock:
+        return {dataset: dict(values) for dataset, values in _unparsed_dates.items()}
+
+
 def parse_date(date_string: str) -> Optional[datetime.date]:
     """
     Parse date string in various formats to datetime.date object.
     
+    Use parse_dates for whole columns.
+    
     Args:
         date_string: String containing a date
         
     Returns:
         datetime.date object or None if parsing fails
     """
-    try:
-        return pd.to_datetime(date_string, format="%Y/%m/%d").date()
-    except ValueError:
+    for fmt in DATE_FORMATS:
         try:
-            return pd.to_datetime(date_string, format="%Y-%m-%d").date()
+            return datetime.datetime.strptime(str(date_string).strip(), fmt).date()
         except ValueError:
-            # Add more formats as needed
-            return None
+            continue
+    return None
 
 
-def savedf(df: pd.DataFrame, basename: str) -> None:
+def month_key(dates: pd.Series) -> pd.Series:
+    """
+    Get the "YYYY-MM" month of every date in a column.
+    
+    Args:
+        dates: Series of dates (datetime64 or date objects)
+        
+    Returns:
+        Series of month strings, NA where the date is missing
+    """
+    dates = pd.to_datetime(dates)
+    months = dates.dt.to_period("M").astype(str)
+    return months.astype(object).where(dates.notna(), pd.NA)
+
+
+def savedf(df: pd.DataFrame, basename: str) -> str:
     """
     Save DataFrame to CSV in the pensafe directory.
     
     Args:
         df: DataFrame to save
         basename: Base filename (without .csv extension)
+        
+    Returns:
+        Path of the saved file
     """
     savename = basename + ".csv"
     savepath = os.path.join(pensafe, savename)
     df.to_csv(savepath)
+    invalidate_csv_cache(savepath)
+    return savepath
 
 
 def get_now() -> str:
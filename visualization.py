@@ -5,6 +5,7 @@ import plotly.express as px
 from collections import Counter
 
 from dbsafe import city2province, sum_amount_by_month
+from utils import month_key
 
 # Define map path constant
 mappath = "map/chinageo.json"
@@ -18,7 +19,7 @@ def display_search_df(searchdf):
         searchdf: DataFrame containing search results
     """
     df_month = searchdf.copy()
-    df_month["month"] = df_month["发布日期"].apply(lambda x: x.strftime("%Y-%m"))
+    df_month["month"] = month_key(df_month["发布日期"])
     df_month_count = df_month.groupby(["month"]).size().reset_index(name="count")
     
     # Display penalty count by month chart
@@ -94,7 +95,7 @@ def display_search_df(searchdf):
     st.markdown(f"##### {image2_text}")
 
     # Display penalty count by region
-    df_org_count = df_month.groupby(["区域"]).size().reset_index(name="count")
+    df_org_count = df_month.groupby(["区域"], observed=True).size().reset_index(name="count")
     df_org_count = df_org_count.sort_values(by=["count"], ascending=False)
     
     org_ls = df_org_count["区域"].tolist()
@@ -0,0 +1,228 @@
+"""
+Background Crawl Worker for DBSafe
+
+Runs the crawl jobs enqueued by the Streamlit page (see jobs.py) outside
+the Streamlit script, so crawls survive page refreshes and reruns. The
+worker claims one job at a time, runs the list, detail or retry crawl and
+records its progress in the job queue for the page to poll.
+
+Run ``python worker.py`` next to the app; ``--once`` processes the queued
+jobs and exits. When the queue is empty and failed pages are due for
+another attempt, the worker queues a retry job itself. Jobs left running by a worker that died are requeued when
+a worker starts, and their crawl sessions resume where they stopped.
+
+Copyright (c) 2023-2024
+License: Apache License 2.0 (see LICENSE file for details)
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Callable, Dict
+
+from compact import COMPACT_THRESHOLD, compact_tree
+from httpcache import get_response_cache
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobCancelled, JobQueue, get_job_queue
+from metrics import get_metrics
+from pacer import save_pacing
+from retryqueue import get_retry_queue
+from scraper import (
+    COUNTS,
+    get_eventdetail,
+    get_safetoupd,
+    retry_failed,
+    update_lists_parallel,
+    update_toupd,
+)
+
+
+# Seconds between polls of an empty queue
+POLL_INTERVAL = 5.0
+
+# Minimum seconds between retry jobs queued by the worker itself
+AUTO_RETRY_INTERVAL = 300.0
+
+Log = Callable[[str, Any], None]
+
+
+def job_logger(queue: JobQueue, job_id: int) -> Log:
+    """
+    Build the progress callback of a job.
+
+    COUNTS messages add to the job's counters; other messages become its
+    latest message. Every call raises JobCancelled once the job is cancelled.
+
+    Args:
+        queue: Job queue
+        job_id: Job id
+
+    Returns:
+        Callback taking a Streamlit message level and a message
+    """
+
+    def log(level: str, message: Any) -> None:
+        if level == COUNTS:
+            queue.progress(job_id, **message)
+        else:
+            queue.progress(job_id, message=str(message))
+
+    return log
+
+
+def run_list_job(params: Dict[str, Any], log: Log) -> None:
+    """
+    Update the case lists of the job's organizations concurrently.
+
+    Args:
+        params: "orgs", "start" and "end"
+        log: Progress callback
+
+    Raises:
+        RuntimeError: If any organization failed
+    """
+
+    def on_progress(orgname: str, level: str, message: Any) -> None:
+        log(level, message if level == COUNTS else f"{orgname}: {message}")
+
+    results = update_lists_parallel(params["orgs"], params["start"], params["end"], on_progress)
+    compact_tree(min_files=COMPACT_THRESHOLD)
+
+    failed = {org: e for org, e in results.items() if isinstance(e, Exception)}
+    for orgname, result in results.items():
+        if orgname not in failed:
+            log("success", f"{orgname}: 更新完成，共{len(result)}条新案例")
+    if failed:
+        raise RuntimeError("; ".join(f"{org}: {e}" for org, e in failed.items()))
+
+
+def run_detail_job(params: Dict[str, Any], log: Log) -> None:
+    """
+    Update the case details of the job's organizations.
+
+    Args:
+        params: "orgs"
+        log: Progress callback
+    """
+    for orgname in params["orgs"]:
+        newsum = update_toupd(orgname)
+        log("info", f"{orgname}: 共{len(newsum)}条案例待更新")
+        if len(newsum) > 0:
+            toupd = get_safetoupd(orgname)
+            eventdetail = get_eventdetail(toupd, orgname, log)
+            log("success", f"{orgname}: 更新完成，共{len(eventdetail)}条案例详情")
+
+    compact_tree(min_files=COMPACT_THRESHOLD)
+
+
+def run_retry_job(params: Dict[str, Any], log: Log) -> None:
+    """
+    Retry the failed pages that are due.
+
+    Args:
+        params: Optional "limit"
+        log: Progress callback
+    """
+    summary = retry_failed(log, params.get("limit"))
+    log(
+        "success",
+        f"修复{summary['fixed']}页，稍后重试{summary['failed']}页，放弃{summary['dead']}页",
+    )
+
+
+RUNNERS = {"list": run_list_job, "detail": run_detail_job, "retry": run_retry_job}
+
+
+def enqueue_due_retries(queue: JobQueue) -> bool:
+    """
+    Queue a retry job if failed pages are due and no retry job is pending.
+
+    Args:
+        queue: Job queue
+
+    Returns:
+        True if a job was queued
+    """
+    if not get_retry_queue().due(limit=1):
+        return False
+    pending = [
+        job
+        for job in queue.recent()
+        if job["kind"] == "retry" and job["state"] in (QUEUED, RUNNING)
+    ]
+    if pending:
+        return False
+    queue.enqueue("retry", {})
+    return True
+
+
+def run_job(queue: JobQueue, job: Dict[str, Any]) -> None:
+    """
+    Run a claimed job and record how it ended.
+
+    The crawl metrics are reset for each job, so the run summary describes
+    the latest job; the response cache counts and the learned pacing are
+    saved when it ends.
+
+    Args:
+        queue: Job queue
+        job: Job claimed from the queue
+    """
+    log = job_logger(queue, job["id"])
+    metrics = get_metrics()
+    metrics.reset()
+    try:
+        RUNNERS[job["kind"]](job["params"], log)
+    except JobCancelled:
+        return
+    except Exception as e:
+        queue.finish(job["id"], FAILED, f"{type(e).__name__}: {e}")
+        return
+    finally:
+        metrics.write()
+        get_response_cache().save_counts()
+        save_pacing()
+    queue.finish(job["id"], DONE)
+
+
+def main() -> None:
+    """Command line entry point of the crawl worker."""
+    parser = argparse.ArgumentParser(description="DBSafe crawl worker")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    parser.add_argument(
+        "--poll", type=float, default=POLL_INTERVAL, help="seconds between queue polls"
+    )
+    parser.add_argument(
+        "--retry-interval",
+        type=float,
+        default=AUTO_RETRY_INTERVAL,
+        help="minimum seconds between automatic retry jobs (0 turns them off)",
+    )
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    requeued = queue.recover()
+    if requeued:
+        print(f"requeued {requeued} interrupted jobs")
+
+    retried_at = None
+    while True:
+        job = queue.claim(os.getpid())
+        if job is None:
+            # Failed pages heal on their own once their backoff has passed
+            idle_retry = args.retry_interval > 0 and (
+                retried_at is None or time.monotonic() - retried_at >= args.retry_interval
+            )
+            if idle_retry and enqueue_due_retries(queue):
+                retried_at = time.monotonic()
+                continue
+            if args.once:
+                break
+            time.sleep(args.poll)
+            continue
+        print(f"job {job['id']}: {job['kind']} {job['params']}")
+        run_job(queue, job)
+        print(f"job {job['id']}: {queue.get(job['id'])['state']}")
+
+
+if __name__ == "__main__":
+    main()